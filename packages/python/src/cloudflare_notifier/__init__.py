@@ -1,7 +1,20 @@
 """cloudflare-notifier — poll Cloudflare security events and react to them."""
 
 from cloudflare_notifier._models import SecurityEvent
+from cloudflare_notifier.replay import RecordingTransport, ReplayTransport
+from cloudflare_notifier.runtime import CloudflareRuntime
+from cloudflare_notifier.sinks import EventSink, JsonlSink, SQLiteSink, StreamSink
 from cloudflare_notifier.watcher import CloudFlareWatcher
 
-__all__ = ["CloudFlareWatcher", "SecurityEvent"]
+__all__ = [
+    "CloudFlareWatcher",
+    "CloudflareRuntime",
+    "EventSink",
+    "JsonlSink",
+    "RecordingTransport",
+    "ReplayTransport",
+    "SQLiteSink",
+    "SecurityEvent",
+    "StreamSink",
+]
 __version__ = "0.1.0"
@@ -1,21 +1,85 @@
 """Internal Cloudflare API client. Not part of the public API."""
 from __future__ import annotations
 
+import asyncio
 import datetime
 import logging
+import time
 import warnings
+from typing import Any, Protocol
 
 import aiohttp
 
 logger = logging.getLogger(__name__)
 
 
+class RequestBudget:
+    """Token bucket allowing ``rate`` requests per ``period`` seconds.
+
+    Shared by every client using the same credential so that they stay under
+    Cloudflare's per-user API rate limit together. Waiters are served in order.
+    """
+
+    def __init__(self, rate: int, period: float) -> None:
+        if rate < 1 or period <= 0:
+            raise ValueError("rate must be at least 1 and period positive.")
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent, then spend one token."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.rate),
+                    self._tokens + (now - self._updated) * self.rate / self.period,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+
+
+class Transport(Protocol):
+    """Sends one API request in place of the HTTP session, e.g. for replay."""
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str],
+        params: dict[str, str | int] | None = None,
+        json: dict[str, object] | None = None,
+        ssl: bool = True,
+    ) -> tuple[int, Any]:
+        """Return the HTTP status and the decoded JSON body."""
+        ...
+
+    def now(self) -> datetime.datetime:
+        """Return the current time as seen by the API, as an aware UTC datetime."""
+        ...
+
+    async def sleep(self, seconds: float) -> None:
+        """Wait ``seconds`` on the transport's clock, e.g. between polls."""
+        ...
+
+
 class CloudflareConnectionManager:
     """Async context manager that wraps an aiohttp session.
 
     Tries the REST security/events and firewall/events endpoints in order,
     then falls back to the GraphQL analytics API so the library works across
     all Cloudflare plans.
+
+    ``session``, ``budget`` and the cache dicts may be supplied by a shared
+    runtime; a session passed in is never closed by this manager. When a
+    ``transport`` is given, every request goes through it instead of HTTP.
     """
 
     def __init__(
@@ -25,6 +89,11 @@ class CloudflareConnectionManager:
         email: str | None = None,
         verify_ssl: bool = True,
         timeout: int = 15,
+        session: aiohttp.ClientSession | None = None,
+        budget: RequestBudget | None = None,
+        zone_cache: dict[str, str] | None = None,
+        rule_message_support: dict[str, bool] | None = None,
+        transport: Transport | None = None,
     ) -> None:
         if not verify_ssl:
             warnings.warn(
@@ -39,9 +108,17 @@ class CloudflareConnectionManager:
         self.base_url = "https://api.cloudflare.com/client/v4"
         self.graphql_url = f"{self.base_url}/graphql"
         self.timeout = aiohttp.ClientTimeout(total=timeout)
-        self.session: aiohttp.ClientSession | None = None
-        self._zone_cache: dict[str, str] = {}
-        self._rule_message_support: dict[str, bool] = {}
+        self.session: aiohttp.ClientSession | None = session
+        self.budget = budget
+        self.transport = transport
+        self._owns_session = session is None
+        self._zone_cache: dict[str, str] = {} if zone_cache is None else zone_cache
+        self._rule_message_support: dict[str, bool] = (
+            {} if rule_message_support is None else rule_message_support
+        )
+        self._inflight: dict[
+            tuple[str, str | None, int], asyncio.Task[list[dict[str, object]]]
+        ] = {}
 
     async def __aenter__(self) -> CloudflareConnectionManager:
         await self._start()
@@ -51,13 +128,36 @@ class CloudflareConnectionManager:
         await self.close()
 
     async def _start(self) -> None:
+        if self.transport is not None or not self._owns_session:
+            return
         if self.session is None or self.session.closed:
             self.session = aiohttp.ClientSession(timeout=self.timeout)
 
     async def close(self) -> None:
-        if self.session and not self.session.closed:
+        if self._owns_session and self.session and not self.session.closed:
             await self.session.close()
 
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: dict[str, str | int] | None = None,
+        json: dict[str, object] | None = None,
+    ) -> tuple[int, Any]:
+        """Send one request and return its HTTP status and decoded JSON body."""
+        if self.budget is not None:
+            await self.budget.acquire()
+        if self.transport is not None:
+            return await self.transport.request(
+                method, url, headers=self._headers(), params=params, json=json, ssl=self.verify_ssl
+            )
+        await self._start()
+        async with self.session.request(  # type: ignore[union-attr]
+            method, url, headers=self._headers(), params=params, json=json, ssl=self.verify_ssl
+        ) as resp:
+            return resp.status, await resp.json(content_type=None)
+
     def _headers(self) -> dict[str, str]:
         headers = {"Content-Type": "application/json"}
         if self.api_token:
@@ -73,7 +173,35 @@ class CloudflareConnectionManager:
         since: str | None = None,
         per_page: int = 50,
     ) -> list[dict[str, object]]:
-        """Return a list of raw event dicts, or raise RuntimeError on unrecoverable error."""
+        """Return a list of raw event dicts, or raise RuntimeError on unrecoverable error.
+
+        Concurrent calls with the same arguments, such as two watchers on one
+        runtime polling the same zone from the same watermark, share a single
+        request. Calls with a different ``since`` are sent separately.
+        """
+        key = (zone_id, since, per_page)
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch_security_events(zone_id, since, per_page))
+            self._inflight[key] = task
+
+            def forget(done: asyncio.Task[list[dict[str, object]]]) -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                if not done.cancelled():
+                    done.exception()  # Retrieved even when every caller was cancelled.
+
+            task.add_done_callback(forget)
+        # Each caller gets its own list; shield keeps one caller's cancellation
+        # from cancelling the request for the others.
+        return list(await asyncio.shield(task))
+
+    async def _fetch_security_events(
+        self,
+        zone_id: str,
+        since: str | None,
+        per_page: int,
+    ) -> list[dict[str, object]]:
         await self._start()
         params: dict[str, str | int] = {"per_page": per_page, "page": 1}
         if since:
@@ -87,23 +215,18 @@ class CloudflareConnectionManager:
         ):
             url = f"{self.base_url}{path}"
             try:
-                async with self.session.get(  # type: ignore[union-attr]
-                    url, headers=self._headers(), params=params, ssl=self.verify_ssl
-                ) as resp:
-                    payload = await resp.json(content_type=None)
-                    if resp.status == 404:
-                        continue
-                    if any(e.get("code") in (7000, 7003) for e in payload.get("errors", [])):
-                        continue
-                    if resp.status != 200 or not payload.get("success", False):
-                        errs = payload.get("errors") or []
-                        detail = ", ".join(
-                            f"[{e.get('code')}] {e.get('message', '')}" for e in errs
-                        )
-                        suffix = f" – {detail}" if detail else ""
-                        failures.append(f"{path}: HTTP {resp.status}{suffix}")
-                        continue
-                    return self._extract_events(payload.get("result"))
+                status, payload = await self._request("GET", url, params=params)
+                if status == 404:
+                    continue
+                if any(e.get("code") in (7000, 7003) for e in payload.get("errors", [])):
+                    continue
+                if status != 200 or not payload.get("success", False):
+                    errs = payload.get("errors") or []
+                    detail = ", ".join(f"[{e.get('code')}] {e.get('message', '')}" for e in errs)
+                    suffix = f" – {detail}" if detail else ""
+                    failures.append(f"{path}: HTTP {status}{suffix}")
+                    continue
+                return self._extract_events(payload.get("result"))
             except Exception as exc:
                 failures.append(f"{path}: {exc}")
 
@@ -121,10 +244,12 @@ class CloudflareConnectionManager:
         await self._start()
         failures = prior_failures or []
         if not since:
-            since = (
-                datetime.datetime.now(datetime.timezone.utc)
-                - datetime.timedelta(minutes=60)
-            ).isoformat().replace("+00:00", "Z")
+            now = (
+                self.transport.now()
+                if self.transport is not None
+                else datetime.datetime.now(datetime.timezone.utc)
+            )
+            since = (now - datetime.timedelta(minutes=60)).isoformat().replace("+00:00", "Z")
 
         use_rule_message = self._rule_message_support.get(zone_id) is not False
 
@@ -148,59 +273,57 @@ class CloudflareConnectionManager:
         """
 
         async def attempt(with_rule_message: bool) -> list[dict[str, object]]:
-            async with self.session.post(  # type: ignore[union-attr]
+            status, data = await self._request(
+                "POST",
                 self.graphql_url,
                 json={
                     "query": build_query(with_rule_message),
                     "variables": {"zone": zone_id, "limit": limit, "since": since},
                 },
-                headers=self._headers(),
-                ssl=self.verify_ssl,
-            ) as resp:
-                data = await resp.json(content_type=None)
-                errors = data.get("errors") or []
-
-                if resp.status == 200 and not errors:
-                    if with_rule_message:
-                        self._rule_message_support[zone_id] = True
-                    events = (
-                        data.get("data", {})
-                        .get("viewer", {})
-                        .get("zones", [{}])[0]
-                        .get("firewallEventsAdaptive", [])
-                    ) or []
-                    return [
-                        {
-                            "action": ev.get("action"),
-                            "source": ev.get("source"),
-                            "client_ip": ev.get("clientIP"),
-                            "client_country_name": ev.get("clientCountryName"),
-                            "rule_id": ev.get("ruleId"),
-                            "rule_message": (
-                                ev.get("ruleMessage") or "" if with_rule_message else ""
-                            ),
-                            "ray_id": ev.get("rayName"),
-                            "datetime": ev.get("datetime"),
-                        }
-                        for ev in events
-                    ]
-
-                is_rule_message_error = with_rule_message and any(
-                    "unknown field" in (e.get("message") or "")
-                    and "ruleMessage" in (e.get("message") or "")
-                    for e in errors
-                )
-                if is_rule_message_error:
-                    self._rule_message_support[zone_id] = False
-                    return await attempt(False)
-
-                detail = ", ".join(e.get("message", "") for e in errors)
-                suffix = f" – {detail}" if detail else ""
-                failures.append(f"graphql: HTTP {resp.status}{suffix}")
-                raise RuntimeError(
-                    f"All Cloudflare endpoints failed for zone {zone_id}:\n  "
-                    + "\n  ".join(failures)
-                )
+            )
+            errors = data.get("errors") or []
+
+            if status == 200 and not errors:
+                if with_rule_message:
+                    self._rule_message_support[zone_id] = True
+                events = (
+                    data.get("data", {})
+                    .get("viewer", {})
+                    .get("zones", [{}])[0]
+                    .get("firewallEventsAdaptive", [])
+                ) or []
+                return [
+                    {
+                        "action": ev.get("action"),
+                        "source": ev.get("source"),
+                        "client_ip": ev.get("clientIP"),
+                        "client_country_name": ev.get("clientCountryName"),
+                        "rule_id": ev.get("ruleId"),
+                        "rule_message": (
+                            ev.get("ruleMessage") or "" if with_rule_message else ""
+                        ),
+                        "ray_id": ev.get("rayName"),
+                        "datetime": ev.get("datetime"),
+                    }
+                    for ev in events
+                ]
+
+            is_rule_message_error = with_rule_message and any(
+                "unknown field" in (e.get("message") or "")
+                and "ruleMessage" in (e.get("message") or "")
+                for e in errors
+            )
+            if is_rule_message_error:
+                self._rule_message_support[zone_id] = False
+                return await attempt(False)
+
+            detail = ", ".join(e.get("message", "") for e in errors)
+            suffix = f" – {detail}" if detail else ""
+            failures.append(f"graphql: HTTP {status}{suffix}")
+            raise RuntimeError(
+                f"All Cloudflare endpoints failed for zone {zone_id}:\n  "
+                + "\n  ".join(failures)
+            )
 
         try:
             return await attempt(use_rule_message)
@@ -213,26 +336,22 @@ class CloudflareConnectionManager:
             ) from exc
 
     async def fetch_zone_name(self, zone_id: str) -> str:
-        """Resolve and cache the human-readable zone name."""
+        """Resolve the human-readable zone name, falling back to the zone ID.
+
+        Only successful lookups are cached, so a failed one is retried on the
+        next call.
+        """
         if zone_id in self._zone_cache:
             return self._zone_cache[zone_id]
-        await self._start()
         try:
-            async with self.session.get(  # type: ignore[union-attr]
-                f"{self.base_url}/zones/{zone_id}",
-                headers=self._headers(),
-                ssl=self.verify_ssl,
-            ) as resp:
-                payload = await resp.json(content_type=None)
-                name = (
-                    payload.get("result", {}).get("name", zone_id)
-                    if payload.get("success")
-                    else zone_id
-                )
+            _, payload = await self._request("GET", f"{self.base_url}/zones/{zone_id}")
         except Exception:
-            name = zone_id
+            return zone_id
+        name = payload.get("result", {}).get("name") if payload.get("success") else None
+        if not name:
+            return zone_id
         self._zone_cache[zone_id] = name
-        return name
+        return str(name)
 
     @staticmethod
     def _extract_events(result: object) -> list[dict[str, object]]:
@@ -0,0 +1,144 @@
+"""Run synchronous event handlers off the event loop. Not part of the public API."""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Executor
+
+from cloudflare_notifier._models import SecurityEvent
+
+logger = logging.getLogger(__name__)
+
+SyncHandler = Callable[[SecurityEvent], object]
+
+
+def _call_each(
+    func: SyncHandler, events: list[SecurityEvent]
+) -> list[tuple[str, Exception]]:
+    """Run ``func`` on every event of a batch inside the executor.
+
+    Module-level so it can be pickled into a process pool. Exceptions are
+    collected per event and sent back instead of aborting the batch. A handler
+    that returns an awaitable cannot be awaited here, so that is reported as
+    an error too.
+    """
+    failures: list[tuple[str, Exception]] = []
+    for event in events:
+        try:
+            result = func(event)
+        except Exception as exc:
+            failures.append((event.ray_id, exc))
+            continue
+        if inspect.isawaitable(result):
+            if inspect.iscoroutine(result):
+                result.close()
+            failures.append(
+                (
+                    event.ray_id,
+                    TypeError(
+                        f"Handler {func!r} returned an awaitable; register an async "
+                        "function or an object with an async __call__ instead."
+                    ),
+                )
+            )
+    return failures
+
+
+def is_async_handler(func: object) -> bool:
+    """Return True for ``async def`` functions and objects with an async ``__call__``."""
+    return inspect.iscoroutinefunction(func) or inspect.iscoroutinefunction(
+        getattr(func, "__call__", None)  # noqa: B004
+    )
+
+
+class OffloadedHandler:
+    """Queue-fed wrapper that runs a synchronous handler in an executor.
+
+    Events are queued without blocking the poller. Up to ``concurrency``
+    worker tasks drain the queue in batches of at most ``batch_size`` events
+    and hand each batch to ``executor`` (the loop's default thread pool when
+    ``None``). With a ``ProcessPoolExecutor`` the handler and the events are
+    pickled, so the handler must be a module-level function.
+
+    The queue holds at most ``max_queue`` events (``0`` for no limit). When
+    it is full, :meth:`submit` waits for room, so a handler that cannot keep
+    up slows dispatch and polling down instead of growing memory.
+    """
+
+    def __init__(
+        self,
+        func: SyncHandler,
+        *,
+        on_error: Callable[[Exception], Awaitable[None]],
+        executor: Executor | None = None,
+        concurrency: int = 1,
+        batch_size: int = 50,
+        max_queue: int = 10_000,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative.")
+        self.func = func
+        self.executor = executor
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._on_error = on_error
+        self._queue: asyncio.Queue[SecurityEvent] | None = None
+        self._workers: list[asyncio.Task[None]] = []
+
+    async def submit(self, event: SecurityEvent) -> None:
+        """Queue an event for the handler, waiting while the queue is full."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.concurrency)
+            ]
+        await self._queue.put(event)
+
+    async def drain(self) -> None:
+        """Wait until every queued event has been handled."""
+        if self._queue is not None and self._workers:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Drain the queue, then stop the workers."""
+        try:
+            await self.drain()
+        finally:
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+            self._queue = None
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                try:
+                    failures = await loop.run_in_executor(
+                        self.executor, _call_each, self.func, batch
+                    )
+                except Exception as exc:
+                    # The executor itself failed (broken pool, unpicklable handler).
+                    logger.error("Executor failed for %d event(s)", len(batch), exc_info=exc)
+                    await self._on_error(exc)
+                    continue
+                for ray_id, error in failures:
+                    logger.error("Event handler raised for ray_id=%s", ray_id, exc_info=error)
+                    await self._on_error(error)
+            finally:
+                for _ in batch:
+                    queue.task_done()
@@ -0,0 +1,415 @@
+"""``cloudflare-notifier`` command: run the watcher as a standalone service.
+
+The service is driven by a JSON config file::
+
+    {
+      "zones": ["zone_id_1", "zone_id_2"],
+      "poll_interval": 60,
+      "allowed_lateness": 120,
+      "max_concurrent_polls": 4,
+      "outputs": [
+        {"type": "stdout"},
+        {"type": "jsonl", "path": "events.jsonl.gz", "compress": true, "max_bytes": 100000000},
+        {"type": "sqlite", "path": "events.db"},
+        {"type": "pipe", "command": ["jq", "-c", "select(.action == \\"block\\")"]}
+      ]
+    }
+
+Zones are polled concurrently, at most ``max_concurrent_polls`` at a time.
+``rate_limit`` requests per ``rate_period`` seconds are allowed per credential.
+
+Credentials are read from the environment: ``CF_API_TOKEN``, or
+``CF_API_KEY`` and ``CF_EMAIL``. A ``"credentials"`` object with
+``api_token_env``, ``api_key_env`` and ``email_env`` names other variables.
+
+SIGINT and SIGTERM stop polling, drain queued events and close outputs.
+SIGHUP reloads the config file; watermarks carry over for unchanged zones.
+
+``--record FILE`` logs every API response with its timing, and
+``--replay FILE`` feeds such a log back instead of calling Cloudflare, so
+``--profile`` can measure the pipeline against identical input.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from cloudflare_notifier._connection import Transport
+from cloudflare_notifier._models import SecurityEvent
+from cloudflare_notifier.replay import RecordingTransport, ReplayTransport
+from cloudflare_notifier.runtime import CloudflareRuntime
+from cloudflare_notifier.sinks import (
+    EventSink,
+    JsonlSink,
+    SQLiteSink,
+    StreamSink,
+    _ndjson_line,
+)
+from cloudflare_notifier.watcher import CloudFlareWatcher
+
+logger = logging.getLogger(__name__)
+
+_OUTPUT_TYPES = ("stdout", "jsonl", "sqlite", "pipe")
+
+
+@dataclass
+class ServiceConfig:
+    """Settings for one run of the service, loaded from the config file."""
+
+    zones: list[str]
+    api_token: str | None = None
+    api_key: str | None = None
+    email: str | None = None
+    poll_interval: int = 60
+    lookback_minutes: int = 15
+    allowed_lateness: int = 0
+    verify_ssl: bool = True
+    max_concurrent_polls: int = 4
+    rate_limit: int = 1200
+    rate_period: float = 300.0
+    outputs: list[dict[str, object]] = field(default_factory=lambda: [{"type": "stdout"}])
+
+
+def load_config(path: str) -> ServiceConfig:
+    """Read and validate a config file. Raises ValueError on invalid settings."""
+    with open(path, encoding="utf-8") as fh:
+        try:
+            data = json.load(fh)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"{path}: invalid JSON: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a JSON object.")
+
+    zones = data.get("zones")
+    if not isinstance(zones, list) or not zones or not all(isinstance(z, str) for z in zones):
+        raise ValueError(f"{path}: 'zones' must be a non-empty list of zone IDs.")
+
+    credentials = data.get("credentials") or {}
+    if not isinstance(credentials, dict):
+        raise ValueError(f"{path}: 'credentials' must be an object.")
+
+    outputs = data.get("outputs", [{"type": "stdout"}])
+    if not isinstance(outputs, list) or not all(isinstance(o, dict) for o in outputs):
+        raise ValueError(f"{path}: 'outputs' must be a list of objects.")
+    for output in outputs:
+        kind = output.get("type")
+        if kind not in _OUTPUT_TYPES:
+            expected = ", ".join(_OUTPUT_TYPES)
+            raise ValueError(f"{path}: unknown output type {kind!r} (expected one of {expected}).")
+        if kind in ("jsonl", "sqlite") and not isinstance(output.get("path"), str):
+            raise ValueError(f"{path}: {kind} output needs a 'path'.")
+        if kind == "pipe":
+            command = output.get("command")
+            if not isinstance(command, list) or not command:
+                raise ValueError(f"{path}: pipe output needs a 'command' list.")
+
+    try:
+        return ServiceConfig(
+            zones=list(zones),
+            api_token=os.environ.get(credentials.get("api_token_env", "CF_API_TOKEN")),
+            api_key=os.environ.get(credentials.get("api_key_env", "CF_API_KEY")),
+            email=os.environ.get(credentials.get("email_env", "CF_EMAIL")),
+            poll_interval=int(data.get("poll_interval", 60)),
+            lookback_minutes=int(data.get("lookback_minutes", 15)),
+            allowed_lateness=int(data.get("allowed_lateness", 0)),
+            verify_ssl=bool(data.get("verify_ssl", True)),
+            max_concurrent_polls=int(data.get("max_concurrent_polls", 4)),
+            rate_limit=int(data.get("rate_limit", 1200)),
+            rate_period=float(data.get("rate_period", 300.0)),
+            outputs=outputs,
+        )
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{path}: {exc}") from exc
+
+
+class _PipeSink(EventSink):
+    """Feed events as JSON lines to the stdin of a child process.
+
+    The process is started on the first write and restarted if it has exited.
+    On close, stdin is closed and the process gets ``close_timeout`` seconds
+    to exit before it is terminated, then killed.
+    """
+
+    def __init__(
+        self,
+        command: list[str],
+        *,
+        flush_size: int = 100,
+        flush_interval: float = 1.0,
+        close_timeout: float = 5.0,
+    ) -> None:
+        super().__init__(flush_size=flush_size, flush_interval=flush_interval)
+        self.command = command
+        self.close_timeout = close_timeout
+        self._process: subprocess.Popen[str] | None = None
+
+    def _write_batch(self, events: list[SecurityEvent]) -> None:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, text=True, encoding="utf-8"
+            )
+        assert self._process.stdin is not None
+        self._process.stdin.write("".join(_ndjson_line(event) + "\n" for event in events))
+        self._process.stdin.flush()
+
+    def _close(self) -> None:
+        if self._process is not None:
+            process, self._process = self._process, None
+            if process.stdin is not None:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            try:
+                process.wait(timeout=self.close_timeout)
+                return
+            except subprocess.TimeoutExpired:
+                logger.warning("%s did not exit, terminating it", self.command[0])
+            process.terminate()
+            try:
+                process.wait(timeout=self.close_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def build_sink(output: dict[str, object]) -> EventSink:
+    """Create the sink for one entry of the config's ``outputs`` list."""
+    options = {
+        k: v for k, v in output.items() if k in ("flush_size", "flush_interval", "max_buffer")
+    }
+    kind = output["type"]
+    if kind == "stdout":
+        return StreamSink(sys.stdout, **options)  # type: ignore[arg-type]
+    if kind == "jsonl":
+        for key in ("max_bytes", "backup_count", "compress", "dedup_size"):
+            if key in output:
+                options[key] = output[key]
+        return JsonlSink(str(output["path"]), **options)  # type: ignore[arg-type]
+    if kind == "sqlite":
+        return SQLiteSink(str(output["path"]), **options)  # type: ignore[arg-type]
+    if kind == "pipe":
+        command = output["command"]
+        assert isinstance(command, list)
+        if "close_timeout" in output:
+            options["close_timeout"] = output["close_timeout"]
+        return _PipeSink([str(part) for part in command], **options)  # type: ignore[arg-type]
+    raise ValueError(f"Unknown output type {kind!r}.")
+
+
+def build_watcher(config: ServiceConfig, runtime: CloudflareRuntime) -> CloudFlareWatcher:
+    """Create a watcher for ``config`` with its outputs attached as sinks."""
+    watcher = CloudFlareWatcher(
+        api_token=config.api_token,
+        api_key=config.api_key,
+        email=config.email,
+        zone_ids=config.zones,
+        poll_interval=config.poll_interval,
+        lookback_minutes=config.lookback_minutes,
+        allowed_lateness=config.allowed_lateness,
+        verify_ssl=config.verify_ssl,
+        runtime=runtime,
+    )
+    for output in config.outputs:
+        watcher.add_sink(build_sink(output))
+
+    @watcher.on_error
+    async def log_error(error: Exception) -> None:
+        logger.warning("%s", error)
+
+    return watcher
+
+
+def _build(
+    config: ServiceConfig, transport: Transport | None
+) -> tuple[CloudflareRuntime, CloudFlareWatcher]:
+    runtime = CloudflareRuntime(
+        max_concurrent_polls=config.max_concurrent_polls,
+        rate_limit=config.rate_limit,
+        rate_period=config.rate_period,
+        transport=transport,
+    )
+    return runtime, build_watcher(config, runtime)
+
+
+# Raised by load_config and build_watcher for a bad config, credentials or output.
+_CONFIG_ERRORS = (OSError, KeyError, TypeError, ValueError)
+
+
+async def _wait_any(*aws: asyncio.Future[Any]) -> None:
+    await asyncio.wait(aws, return_when=asyncio.FIRST_COMPLETED)
+
+
+async def serve(
+    config_path: str,
+    config: ServiceConfig | None = None,
+    *,
+    transport: Transport | None = None,
+) -> None:
+    """Run the service until SIGINT/SIGTERM, reloading the config on SIGHUP.
+
+    On reload the new watcher is built first; if the config, credentials or
+    outputs are invalid, the error is logged and the current watcher keeps
+    running. With a :class:`ReplayTransport`, the service also stops once the
+    recording is exhausted.
+    """
+    loop = asyncio.get_running_loop()
+    shutdown = asyncio.Event()
+    reload = asyncio.Event()
+    installed: list[int] = []
+    for signum, event in (
+        (signal.SIGINT, shutdown),
+        (signal.SIGTERM, shutdown),
+        (getattr(signal, "SIGHUP", None), reload),
+    ):
+        if signum is None:
+            continue
+        try:
+            loop.add_signal_handler(signum, event.set)
+        except (NotImplementedError, RuntimeError):
+            continue  # not supported on this platform or thread
+        installed.append(signum)
+
+    replay_done: asyncio.Task[Literal[True]] | None = None
+    if isinstance(transport, ReplayTransport):
+        replay_done = asyncio.create_task(transport.finished.wait())
+        replay_done.add_done_callback(lambda _: shutdown.set())
+
+    if config is None:
+        config = load_config(config_path)
+    runtime, watcher = _build(config, transport)
+    try:
+        while True:
+            task = asyncio.create_task(watcher.start())
+            logger.info("Watching %d zone(s)", len(config.zones))
+
+            reloaded: tuple[ServiceConfig, CloudflareRuntime, CloudFlareWatcher] | None = None
+            shutdown_wait = asyncio.ensure_future(shutdown.wait())
+            try:
+                while reloaded is None and not shutdown.is_set() and not task.done():
+                    reload_wait = asyncio.ensure_future(reload.wait())
+                    try:
+                        await _wait_any(task, shutdown_wait, reload_wait)
+                    finally:
+                        reload_wait.cancel()
+                    if reload.is_set():
+                        reload.clear()
+                        try:
+                            new_config = load_config(config_path)
+                            reloaded = (new_config, *_build(new_config, transport))
+                        except _CONFIG_ERRORS as exc:
+                            logger.error("Reload failed, keeping current config: %s", exc)
+            finally:
+                shutdown_wait.cancel()
+                logger.info("Stopping; draining queued events")
+                await watcher.stop()
+                try:
+                    await task
+                finally:
+                    await runtime.close()
+
+            if reloaded is None:
+                return
+            logger.info("Reloaded %s", config_path)
+            config, runtime, replacement = reloaded
+            replacement.resume_from(watcher)
+            watcher = replacement
+    finally:
+        if replay_done is not None:
+            replay_done.cancel()
+        for signum in installed:
+            loop.remove_signal_handler(signum)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Entry point for the ``cloudflare-notifier`` console script."""
+    parser = argparse.ArgumentParser(
+        prog="cloudflare-notifier",
+        description="Poll Cloudflare security events and write them to the configured outputs.",
+    )
+    parser.add_argument("config", help="path to the JSON config file")
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="write cProfile stats for the polling loop to FILE on exit",
+    )
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument(
+        "--record",
+        metavar="FILE",
+        help="append every API response with its timing to FILE (.gz to compress)",
+    )
+    recording.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="serve API responses from a recording instead of calling Cloudflare",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        metavar="X",
+        help="replay at X times the recorded speed; 0 means as fast as possible (default: 1)",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+        help="log level for messages on stderr (default: INFO)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=args.log_level,
+        stream=sys.stderr,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    try:
+        config = load_config(args.config)
+        # Fail on bad credentials or outputs before anything is opened.
+        build_watcher(config, CloudflareRuntime())
+    except _CONFIG_ERRORS as exc:
+        print(f"cloudflare-notifier: {exc}", file=sys.stderr)
+        return 2
+
+    transport: RecordingTransport | ReplayTransport | None = None
+    if args.record:
+        transport = RecordingTransport(args.record)
+    elif args.replay:
+        try:
+            transport = ReplayTransport(args.replay, speed=args.replay_speed or None)
+        except (OSError, ValueError) as exc:
+            print(f"cloudflare-notifier: {exc}", file=sys.stderr)
+            return 2
+
+    async def run() -> None:
+        if transport is None:
+            await serve(args.config, config)
+            return
+        async with transport:
+            await serve(args.config, config, transport=transport)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logger.info("Wrote profile to %s", args.profile)
+    return 0
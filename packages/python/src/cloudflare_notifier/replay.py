@@ -0,0 +1,245 @@
+"""Record Cloudflare API responses and replay them deterministically.
+
+A recording is a JSON-lines log (gzip-compressed when the path ends in
+``.gz``). Each line holds one response with its timing::
+
+    {"t": 12.03, "at": 1704110412.03, "elapsed": 0.41, "method": "POST",
+     "url": ".../graphql", "zone": "abc123", "status": 200, "payload": {...}}
+
+``t`` is when the request started, in seconds since recording began, ``at``
+is the same moment as a Unix timestamp, and ``elapsed`` is how long the
+response took. Requests that failed without a response store ``"error"``
+instead of ``status`` and ``payload``.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import IO, Any, cast
+
+import aiohttp
+
+
+class ReplayExhausted(RuntimeError):
+    """Raised by :class:`ReplayTransport` once every recorded response was served."""
+
+
+def _open(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return cast(IO[str], gzip.open(path, mode + "t", encoding="utf-8"))
+    return open(path, mode, encoding="utf-8")
+
+
+def _key(method: str, url: str, zone: str | None) -> str:
+    # Query strings change from run to run (the ``since`` cursor), so responses
+    # are matched on method, URL path and, for GraphQL, the zone variable.
+    return f"{method} {url} {zone}" if zone else f"{method} {url}"
+
+
+def _zone(json: dict[str, object] | None) -> str | None:
+    variables = (json or {}).get("variables")
+    if isinstance(variables, dict):
+        zone = variables.get("zone")
+        return str(zone) if zone else None
+    return None
+
+
+class RecordingTransport:
+    """Send requests over HTTP and append every response to a recording.
+
+    Use as the ``transport`` of a :class:`CloudFlareWatcher` or
+    :class:`CloudflareRuntime`, and close it when done::
+
+        async with RecordingTransport("traffic.jsonl.gz") as transport:
+            watcher = CloudFlareWatcher(..., transport=transport)
+    """
+
+    def __init__(self, path: str | os.PathLike[str], *, timeout: int = 15) -> None:
+        self.path = Path(path)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+        self._file: IO[str] | None = None
+        self._origin: float | None = None
+
+    async def __aenter__(self) -> RecordingTransport:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.close()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str],
+        params: dict[str, str | int] | None = None,
+        json: dict[str, object] | None = None,
+        ssl: bool = True,
+    ) -> tuple[int, Any]:
+        """Send the request and record its outcome."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        started = time.monotonic()
+        if self._origin is None:
+            self._origin = started
+        record: dict[str, object] = {
+            "t": round(started - self._origin, 6),
+            "at": round(time.time(), 6),
+            "method": method,
+            "url": url,
+        }
+        zone = _zone(json)
+        if zone:
+            record["zone"] = zone
+        try:
+            async with self._session.request(
+                method, url, headers=headers, params=params, json=json, ssl=ssl
+            ) as resp:
+                payload = await resp.json(content_type=None)
+        except Exception as exc:
+            record["elapsed"] = round(time.monotonic() - started, 6)
+            record["error"] = f"{type(exc).__name__}: {exc}"
+            self._write(record)
+            raise
+        record["elapsed"] = round(time.monotonic() - started, 6)
+        record["status"] = resp.status
+        record["payload"] = payload
+        self._write(record)
+        return resp.status, payload
+
+    def now(self) -> datetime.datetime:
+        """Return the current UTC time; recording runs against the real clock."""
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    async def sleep(self, seconds: float) -> None:
+        """Wait in real time."""
+        await asyncio.sleep(seconds)
+
+    async def close(self) -> None:
+        """Close the HTTP session and the recording file."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record: dict[str, object]) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = _open(self.path, "a")
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+
+class ReplayTransport:
+    """Serve responses from a recording instead of calling the API.
+
+    Responses are matched to requests by method, URL and zone, in recorded
+    order. With ``speed=1.0`` each response is held back until the moment it
+    originally completed, measured from the first replayed request.
+    ``speed=10`` replays ten times faster, and ``speed=None`` as fast as
+    possible. The watcher waits between polls through :meth:`sleep`, so
+    its ``poll_interval`` is scaled the same way.
+
+    :meth:`now` follows the recording's clock rather than the real one, so a
+    watcher's lookback cutoff and watermarks line up with the recorded event
+    timestamps however old the recording is.
+
+    Once every recorded response has been served, the next request sets
+    :attr:`finished` and raises :class:`ReplayExhausted`.
+    """
+
+    def __init__(self, path: str | os.PathLike[str], *, speed: float | None = 1.0) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive, or None for as fast as possible.")
+        self.path = Path(path)
+        self.speed = speed
+        self.finished = asyncio.Event()
+        self._responses: dict[str, deque[dict[str, Any]]] = {}
+        self._remaining = 0
+        self._origin: float | None = None
+        # Unix time at which the recording began, and how far into it replay has got.
+        self._started_at: float | None = None
+        self._clock = 0.0
+        with _open(self.path, "r") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = _key(record["method"], record["url"], record.get("zone"))
+                self._responses.setdefault(key, deque()).append(record)
+                self._remaining += 1
+                if "at" in record:
+                    started_at = float(record["at"]) - float(record["t"])
+                    if self._started_at is None or started_at < self._started_at:
+                        self._started_at = started_at
+
+    async def __aenter__(self) -> ReplayTransport:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.close()
+
+    @property
+    def remaining(self) -> int:
+        """Number of recorded responses not yet served."""
+        return self._remaining
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str],
+        params: dict[str, str | int] | None = None,
+        json: dict[str, object] | None = None,
+        ssl: bool = True,
+    ) -> tuple[int, Any]:
+        """Return the next recorded response for this request."""
+        if self._remaining == 0:
+            self.finished.set()
+            raise ReplayExhausted(f"Recording {self.path} has no responses left.")
+        queue = self._responses.get(_key(method, url, _zone(json)))
+        if not queue:
+            raise ReplayExhausted(f"No recorded response left for {method} {url}.")
+        record = queue.popleft()
+        self._remaining -= 1
+        self._clock = max(self._clock, float(record["t"]) + float(record["elapsed"]))
+
+        if self.speed is not None:
+            now = time.monotonic()
+            if self._origin is None:
+                self._origin = now - float(record["t"]) / self.speed
+            due = self._origin + (float(record["t"]) + float(record["elapsed"])) / self.speed
+            if due > now:
+                await asyncio.sleep(due - now)
+
+        if "error" in record:
+            raise ConnectionError(record["error"])
+        return int(record["status"]), record["payload"]
+
+    def now(self) -> datetime.datetime:
+        """Return the recorded time at which the last served response completed.
+
+        Before the first request this is when the recording began. Logs
+        written without ``at`` fall back to the real clock.
+        """
+        if self._started_at is None:
+            return datetime.datetime.now(datetime.timezone.utc)
+        return datetime.datetime.fromtimestamp(
+            self._started_at + self._clock, datetime.timezone.utc
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        """Wait ``seconds`` divided by ``speed``, or not at all when ``speed`` is None."""
+        await asyncio.sleep(0 if self.speed is None else seconds / self.speed)
+
+    async def close(self) -> None:
+        """Nothing to release; present so both transports are used the same way."""
@@ -0,0 +1,117 @@
+"""Shared connection runtime for running several watchers in one process."""
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+
+from cloudflare_notifier._connection import (
+    CloudflareConnectionManager,
+    RequestBudget,
+    Transport,
+)
+from cloudflare_notifier.replay import ReplayTransport
+
+_Credential = tuple[str | None, str | None, str | None]
+
+
+class CloudflareRuntime:
+    """Connection pool, caches, rate budgets and poll scheduling shared by watchers.
+
+    Pass the same runtime to several :class:`CloudFlareWatcher` instances::
+
+        async with CloudflareRuntime(max_concurrent_polls=8) as runtime:
+            a = CloudFlareWatcher(api_token=TOKEN_A, zone_ids=[...], runtime=runtime)
+            b = CloudFlareWatcher(api_token=TOKEN_B, zone_ids=[...], runtime=runtime)
+            await asyncio.gather(a.start(), b.start())
+
+    All watchers use one aiohttp connection pool and one API client per
+    credential. Zone names are cached per credential, since a zone visible
+    to one token may not be to another; the per-zone ``ruleMessage``
+    support cache is shared. Watchers using the same credential share one
+    request when they poll the same zone from the same watermark at the
+    same time; polls from different watermarks are sent separately.
+    Requests made with the same credential draw from one budget of
+    ``rate_limit`` requests per ``rate_period`` seconds (Cloudflare allows
+    1200 per 5 minutes per user). Every watcher polls its zones
+    concurrently, and at most ``max_concurrent_polls`` zone polls run at
+    once across every attached watcher. A ``transport``, such
+    as a :class:`~cloudflare_notifier.replay.ReplayTransport`, replaces HTTP
+    for every client; replayed requests are not charged to the budgets.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent_polls: int = 4,
+        rate_limit: int = 1200,
+        rate_period: float = 300.0,
+        timeout: int = 15,
+        transport: Transport | None = None,
+    ) -> None:
+        if max_concurrent_polls < 1:
+            raise ValueError("max_concurrent_polls must be at least 1.")
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.transport = transport
+        self._session: aiohttp.ClientSession | None = None
+        self._clients: dict[tuple[_Credential, bool], CloudflareConnectionManager] = {}
+        self._budgets: dict[_Credential, RequestBudget] = {}
+        self._zone_caches: dict[_Credential, dict[str, str]] = {}
+        self._rule_message_support: dict[str, bool] = {}
+        self._poll_slots = asyncio.Semaphore(max_concurrent_polls)
+
+    async def __aenter__(self) -> CloudflareRuntime:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.close()
+
+    async def client(
+        self,
+        *,
+        api_token: str | None = None,
+        api_key: str | None = None,
+        email: str | None = None,
+        verify_ssl: bool = True,
+    ) -> CloudflareConnectionManager:
+        """Return the shared API client for a credential, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+            self._clients.clear()
+        credential = (api_token, api_key, email)
+        key = (credential, verify_ssl)
+        client = self._clients.get(key)
+        if client is None:
+            budget: RequestBudget | None = None
+            # Replayed requests never reach the API, so they are not rate limited.
+            if not isinstance(self.transport, ReplayTransport):
+                budget = self._budgets.get(credential)
+                if budget is None:
+                    budget = self._budgets[credential] = RequestBudget(
+                        self.rate_limit, self.rate_period
+                    )
+            client = self._clients[key] = CloudflareConnectionManager(
+                api_token=api_token,
+                api_key=api_key,
+                email=email,
+                verify_ssl=verify_ssl,
+                session=self._session,
+                budget=budget,
+                zone_cache=self._zone_caches.setdefault(credential, {}),
+                rule_message_support=self._rule_message_support,
+                transport=self.transport,
+            )
+        return client
+
+    def poll_slot(self) -> asyncio.Semaphore:
+        """Semaphore every attached watcher holds while polling one zone."""
+        return self._poll_slots
+
+    async def close(self) -> None:
+        """Close the shared connection pool. Stop attached watchers first."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._clients.clear()
@@ -0,0 +1,396 @@
+"""Built-in sinks that write security events to files, databases and streams in bulk."""
+from __future__ import annotations
+
+import abc
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import IO, cast
+
+from cloudflare_notifier._models import SecurityEvent
+
+logger = logging.getLogger(__name__)
+
+
+class EventSink(abc.ABC):
+    """Buffer events and write them in bulk off the event loop.
+
+    Events are flushed once ``flush_size`` are buffered or ``flush_interval``
+    seconds have passed, whichever comes first. Writes run in a worker thread
+    and never overlap. Subclasses implement :meth:`_write_batch` and
+    optionally :meth:`_close`; both run in that worker thread.
+
+    A batch that fails to write goes back into the buffer. Background
+    flushes then back off, waiting 1 second after the first failure and
+    doubling up to 60 seconds, so a broken store is retried (and reported)
+    once per backoff rather than once per event. While writes keep failing,
+    the buffer holds at most ``max_buffer`` events; the oldest are dropped
+    beyond that.
+
+    Attach a sink with :meth:`CloudFlareWatcher.add_sink`, which also flushes
+    and closes it when the watcher stops.
+    """
+
+    def __init__(
+        self,
+        *,
+        flush_size: int = 500,
+        flush_interval: float = 5.0,
+        max_buffer: int = 100_000,
+    ) -> None:
+        if flush_size < 1:
+            raise ValueError("flush_size must be at least 1.")
+        if max_buffer < flush_size:
+            raise ValueError("max_buffer must be at least flush_size.")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[SecurityEvent] = []
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task[None] | None = None
+        self._flush_task: asyncio.Task[None] | None = None
+        # Loop time before which background flushes are not attempted, after a failure.
+        self._retry_at = 0.0
+        self._backoff = 0.0
+        self._on_error: Callable[[Exception], Awaitable[None]] | None = None
+
+    async def write(self, event: SecurityEvent) -> None:
+        """Buffer an event. Returns immediately; the flush happens in the background."""
+        self._buffer.append(event)
+        if self._timer is None and self.flush_interval > 0:
+            self._timer = asyncio.create_task(self._flush_periodically())
+        if len(self._buffer) >= self.flush_size:
+            self._schedule_flush()
+
+    async def flush(self) -> None:
+        """Write all buffered events now.
+
+        If the write fails, the events are put back in front of anything
+        buffered since, and the error is raised.
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except BaseException:
+                self._buffer[:0] = batch
+                overflow = len(self._buffer) - self.max_buffer
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    logger.error(
+                        "%s buffer is full, dropped the %d oldest event(s)",
+                        type(self).__name__,
+                        overflow,
+                    )
+                raise
+
+    async def close(self) -> None:
+        """Flush what is left and release the underlying storage."""
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._flush_logged()
+        async with self._lock:
+            await asyncio.to_thread(self._close)
+
+    @abc.abstractmethod
+    def _write_batch(self, events: list[SecurityEvent]) -> None:
+        """Write a batch to storage. Raise to have the batch retried later."""
+
+    def _close(self) -> None:  # noqa: B027 - optional hook
+        """Release storage after the final flush. Does nothing by default."""
+
+    def _schedule_flush(self) -> None:
+        """Start one background flush unless one is running or a retry is not yet due."""
+        if self._flush_task is not None:
+            return
+        if asyncio.get_running_loop().time() < self._retry_at:
+            return
+        self._flush_task = asyncio.create_task(self._flush_logged())
+        self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task[None]) -> None:
+        if self._flush_task is task:
+            self._flush_task = None
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._schedule_flush()
+
+    async def _flush_logged(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await self.flush()
+        except Exception as exc:
+            self._backoff = min(max(self._backoff * 2, 1.0), 60.0)
+            self._retry_at = loop.time() + self._backoff
+            logger.exception("%s failed to write events", type(self).__name__)
+            if self._on_error is not None:
+                await self._on_error(exc)
+        else:
+            self._backoff = 0.0
+            self._retry_at = 0.0
+
+
+class JsonlSink(EventSink):
+    """Append events as JSON lines, with optional size-based rotation and gzip.
+
+    Each line holds the normalized :class:`SecurityEvent` fields plus the raw
+    Cloudflare payload under ``"raw"``. Once the file reaches ``max_bytes`` it
+    is renamed to ``<path>.1`` (older files shift up to ``backup_count``) and
+    a fresh file is started. ``max_bytes=0`` disables rotation.
+
+    Events whose ``ray_id`` was written recently are skipped. The last
+    ``dedup_size`` ray IDs are remembered in memory. Before its first write
+    the sink reads them back from the existing file and its backups, newest
+    first, so a restarted service does not append its lookback window again.
+    That read scans those files once.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        max_bytes: int = 0,
+        backup_count: int = 5,
+        compress: bool = False,
+        dedup_size: int = 100_000,
+        flush_size: int = 500,
+        flush_interval: float = 5.0,
+        max_buffer: int = 100_000,
+    ) -> None:
+        super().__init__(
+            flush_size=flush_size, flush_interval=flush_interval, max_buffer=max_buffer
+        )
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.dedup_size = dedup_size
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._seeded = False
+
+    def _write_batch(self, events: list[SecurityEvent]) -> None:
+        if not self._seeded:
+            self._seed_seen()
+            self._seeded = True
+        lines: list[str] = []
+        written: dict[str, None] = {}
+        for event in events:
+            if event.ray_id:
+                if event.ray_id in self._seen or event.ray_id in written:
+                    continue
+                written[event.ray_id] = None
+            lines.append(_ndjson_line(event))
+        if not lines:
+            return
+
+        if self.max_bytes and self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            self._rotate()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _open_text(self.path, self.compress, "a") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+        # Only remember ray IDs once they are on disk, so a retried batch is not skipped.
+        for ray_id in written:
+            self._seen[ray_id] = None
+            if len(self._seen) > self.dedup_size:
+                self._seen.popitem(last=False)
+
+    def _seed_seen(self) -> None:
+        """Remember the ray IDs of the newest ``dedup_size`` lines already on disk."""
+        files = [self.path] + [
+            self.path.with_name(f"{self.path.name}.{index}")
+            for index in range(1, self.backup_count + 1)
+        ]
+        recent: list[str] = []
+        for file in files:
+            if len(recent) >= self.dedup_size or not file.exists():
+                break
+            tail: deque[str] = deque(maxlen=self.dedup_size - len(recent))
+            try:
+                with _open_text(file, self.compress) as fh:
+                    for line in fh:
+                        tail.append(line)
+            except (OSError, EOFError, UnicodeDecodeError) as exc:
+                # A file cut short by a crash still yields the lines read so far.
+                logger.warning("Could not read all of %s for deduplication: %s", file, exc)
+            ray_ids: list[str] = []
+            for line in tail:
+                try:
+                    ray_id = json.loads(line).get("ray_id")
+                except (ValueError, AttributeError):
+                    continue
+                if ray_id:
+                    ray_ids.append(str(ray_id))
+            recent[:0] = ray_ids
+        for ray_id in recent[-self.dedup_size :]:
+            self._seen[ray_id] = None
+
+    def _rotate(self) -> None:
+        if self.backup_count < 1:
+            self.path.unlink()
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{index}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+
+class StreamSink(EventSink):
+    """Write events as JSON lines to an open text stream such as ``sys.stdout``.
+
+    The stream is flushed after every batch and left open on :meth:`close`.
+    """
+
+    def __init__(
+        self,
+        stream: IO[str],
+        *,
+        flush_size: int = 100,
+        flush_interval: float = 1.0,
+        max_buffer: int = 100_000,
+    ) -> None:
+        super().__init__(
+            flush_size=flush_size, flush_interval=flush_interval, max_buffer=max_buffer
+        )
+        self.stream = stream
+
+    def _write_batch(self, events: list[SecurityEvent]) -> None:
+        self.stream.write("".join(_ndjson_line(event) + "\n" for event in events))
+        self.stream.flush()
+
+
+class SQLiteSink(EventSink):
+    """Insert events into a SQLite database in one transaction per flush.
+
+    The ``events`` table is created on first write, indexed on zone and
+    timestamp, timestamp, client IP and rule ID. ``ray_id`` is unique, so
+    writing the same event twice is a no-op. Timestamps are stored as UTC
+    ISO 8601 strings, which sort chronologically.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            ray_id TEXT UNIQUE,
+            zone_id TEXT NOT NULL,
+            zone_name TEXT NOT NULL,
+            occurred_at TEXT,
+            action TEXT NOT NULL,
+            source TEXT NOT NULL,
+            client_ip TEXT NOT NULL,
+            country TEXT NOT NULL,
+            rule_id TEXT NOT NULL,
+            rule_message TEXT NOT NULL,
+            raw TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_zone_time ON events (zone_id, occurred_at);
+        CREATE INDEX IF NOT EXISTS events_time ON events (occurred_at);
+        CREATE INDEX IF NOT EXISTS events_client_ip ON events (client_ip);
+        CREATE INDEX IF NOT EXISTS events_rule ON events (rule_id);
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        flush_size: int = 500,
+        flush_interval: float = 5.0,
+        max_buffer: int = 100_000,
+    ) -> None:
+        super().__init__(
+            flush_size=flush_size, flush_interval=flush_interval, max_buffer=max_buffer
+        )
+        self.path = Path(path)
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Writes are serialized by the sink lock but may run on any worker thread.
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _write_batch(self, events: list[SecurityEvent]) -> None:
+        conn = self._connect()
+        rows = [
+            (
+                event.ray_id or None,
+                event.zone_id,
+                event.zone_name,
+                _iso(event.occurred_at),
+                event.action,
+                event.source,
+                event.client_ip,
+                event.country,
+                event.rule_id,
+                event.rule_message,
+                json.dumps(event.raw, default=str, separators=(",", ":")),
+            )
+            for event in events
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO events (ray_id, zone_id, zone_name, occurred_at, action,"
+                " source, client_ip, country, rule_id, rule_message, raw)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# ------------------------------------------------------------------ helpers
+
+def _open_text(path: Path, compress: bool, mode: str = "r") -> IO[str]:
+    if compress:
+        return cast(IO[str], gzip.open(path, mode + "t", encoding="utf-8"))
+    return open(path, mode, encoding="utf-8")
+
+
+def _iso(ts: datetime.datetime | None) -> str | None:
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts.astimezone(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _event_record(event: SecurityEvent) -> dict[str, object]:
+    return {
+        "zone_id": event.zone_id,
+        "zone_name": event.zone_name,
+        "action": event.action,
+        "source": event.source,
+        "client_ip": event.client_ip,
+        "country": event.country,
+        "rule_id": event.rule_id,
+        "rule_message": event.rule_message,
+        "ray_id": event.ray_id,
+        "occurred_at": _iso(event.occurred_at),
+        "raw": event.raw,
+    }
+
+
+def _ndjson_line(event: SecurityEvent) -> str:
+    return json.dumps(_event_record(event), default=str, separators=(",", ":"))
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import datetime
 import logging
 from collections.abc import Awaitable, Callable
+from concurrent.futures import Executor
+from typing import Any, TypeVar, overload
 
-from cloudflare_notifier._connection import CloudflareConnectionManager
+from cloudflare_notifier._connection import CloudflareConnectionManager, Transport
 from cloudflare_notifier._models import SecurityEvent
+from cloudflare_notifier._offload import OffloadedHandler, is_async_handler
+from cloudflare_notifier.runtime import CloudflareRuntime
+from cloudflare_notifier.sinks import EventSink
 
 logger = logging.getLogger(__name__)
 
 _Handler = Callable[[SecurityEvent], Awaitable[None]]
 _ErrorHandler = Callable[[Exception], Awaitable[None]]
+_AnyHandler = TypeVar("_AnyHandler", bound=Callable[[SecurityEvent], Any])
 
 
 class CloudFlareWatcher:
@@ -43,12 +50,18 @@ class CloudFlareWatcher:
         zone_ids: list[str],
         poll_interval: int = 60,
         lookback_minutes: int = 15,
+        allowed_lateness: int = 0,
         verify_ssl: bool = True,
+        executor: Executor | None = None,
+        runtime: CloudflareRuntime | None = None,
+        transport: Transport | None = None,
     ) -> None:
         if not api_token and not (api_key and email):
             raise ValueError("Provide api_token or both api_key and email.")
         if not zone_ids:
             raise ValueError("Provide at least one zone_id.")
+        if runtime is not None and transport is not None:
+            raise ValueError("Pass transport to the runtime, not to the watcher.")
 
         self._api_token = api_token
         self._api_key = api_key
@@ -56,16 +69,49 @@ class CloudFlareWatcher:
         self._zone_ids = list(zone_ids)
         self._poll_interval = poll_interval
         self._lookback_minutes = lookback_minutes
+        self._allowed_lateness = datetime.timedelta(seconds=allowed_lateness)
         self._verify_ssl = verify_ssl
+        self._executor = executor
+        self._runtime = runtime
+        self._transport = transport
 
         self._handlers: list[_Handler] = []
+        self._offloaded: list[OffloadedHandler] = []
+        self._sinks: list[EventSink] = []
         self._error_handlers: list[_ErrorHandler] = []
         self._last_seen: dict[str, datetime.datetime | None] = {}
+        self._seen_ray_ids: dict[str, dict[str, datetime.datetime | None]] = {}
+        self._lateness: dict[str, datetime.timedelta] = {}
+        # Zones whose watermark comes from a real event rather than the lookback cutoff.
+        self._watermarked: set[str] = set()
+        # Per zone: when the last successful query was sent, and where its window began.
+        self._last_poll: dict[str, tuple[datetime.datetime, datetime.datetime | None]] = {}
         self._running = False
         self._stop_event: asyncio.Event | None = None
 
-    def on_event(self, func: _Handler) -> _Handler:
-        """Register an async handler for every new security event.
+    @overload
+    def on_event(self, func: _AnyHandler) -> _AnyHandler: ...
+
+    @overload
+    def on_event(
+        self,
+        *,
+        executor: Executor | None = None,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+        max_queue: int | None = None,
+    ) -> Callable[[_AnyHandler], _AnyHandler]: ...
+
+    def on_event(
+        self,
+        func: Callable[[SecurityEvent], Any] | None = None,
+        *,
+        executor: Executor | None = None,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+        max_queue: int | None = None,
+    ) -> Any:
+        """Register a handler for every new security event.
 
         Can be used as a decorator or called directly::
 
@@ -74,30 +120,128 @@ class CloudFlareWatcher:
 
             # or
             watcher.on_event(my_async_handler)
+
+        Async handlers (``async def`` functions or objects with an async
+        ``__call__``) run on the event loop and are awaited in order.
+        Plain (sync) functions are queued and run in ``executor`` — the
+        watcher's executor when omitted, else the loop's default thread
+        pool — so blocking work does not stall polling. ``concurrency``
+        (default 1) caps how many batches of at most ``batch_size`` events
+        (default 50) run at once for that handler::
+
+            @watcher.on_event(executor=process_pool, concurrency=4)
+            def classify(event: SecurityEvent) -> None: ...
+
+        Each sync handler queues at most ``max_queue`` events (default
+        10,000; ``0`` for no limit). When the queue is full, dispatch waits
+        for room, which delays the next poll rather than growing memory.
+
+        Handlers sent to a ``ProcessPoolExecutor`` must be module-level
+        functions; events are pickled across in batches. The executor
+        options only apply to sync handlers; passing them for an async
+        handler raises ``ValueError``.
         """
-        self._handlers.append(func)
-        return func
+
+        def register(handler: _AnyHandler) -> _AnyHandler:
+            if is_async_handler(handler):
+                options = (executor, concurrency, batch_size, max_queue)
+                if any(option is not None for option in options):
+                    raise ValueError(
+                        "executor, concurrency, batch_size and max_queue only apply "
+                        "to sync handlers."
+                    )
+                self._handlers.append(handler)
+            else:
+                self._offloaded.append(
+                    OffloadedHandler(
+                        handler,
+                        on_error=self._dispatch_error,
+                        executor=executor or self._executor,
+                        concurrency=1 if concurrency is None else concurrency,
+                        batch_size=50 if batch_size is None else batch_size,
+                        max_queue=10_000 if max_queue is None else max_queue,
+                    )
+                )
+            return handler
+
+        if func is None:
+            return register
+        return register(func)
 
     def on_error(self, func: _ErrorHandler) -> _ErrorHandler:
         """Register an async handler for polling and event handler errors."""
         self._error_handlers.append(func)
         return func
 
+    def observed_lateness(self) -> dict[str, datetime.timedelta]:
+        """Return, per zone, the largest delay seen before an event became visible.
+
+        An event is late when an earlier poll covered its timestamp but did
+        not return it. Its lateness is the time between the event and that
+        poll, a lower bound on how long Cloudflare took to make it
+        queryable. Compare these values against ``allowed_lateness``: an
+        event later than the overlap falls outside every query window, so it
+        is neither delivered nor counted here.
+        """
+        return dict(self._lateness)
+
+    def resume_from(self, other: CloudFlareWatcher) -> None:
+        """Continue where a stopped watcher left off for the zones both watch.
+
+        Copies the watermark, ray-ID deduplication state and lateness
+        statistics, so replacing a watcher (for example after a config
+        reload) neither re-delivers nor skips events. Call it before
+        :meth:`start`, once ``other`` has stopped.
+        """
+        for zone_id in self._zone_ids:
+            if zone_id in other._last_seen:
+                self._last_seen[zone_id] = other._last_seen[zone_id]
+            if zone_id in other._seen_ray_ids:
+                self._seen_ray_ids[zone_id] = dict(other._seen_ray_ids[zone_id])
+            if zone_id in other._lateness:
+                self._lateness[zone_id] = other._lateness[zone_id]
+            if zone_id in other._last_poll:
+                self._last_poll[zone_id] = other._last_poll[zone_id]
+            if zone_id in other._watermarked:
+                self._watermarked.add(zone_id)
+
+    def add_sink(self, sink: EventSink) -> EventSink:
+        """Persist every new event through a built-in sink.
+
+        The sink buffers events and writes them in bulk off the event loop.
+        It is flushed and closed when :meth:`start` returns::
+
+            watcher.add_sink(SQLiteSink("events.db"))
+        """
+        sink._on_error = self._dispatch_error
+        self._sinks.append(sink)
+        return sink
+
     async def start(self) -> None:
         """Start polling. Blocks until :meth:`stop` is called or the task is cancelled."""
         self._running = True
         self._stop_event = asyncio.Event()
-        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        cutoff = self._now() - datetime.timedelta(
             minutes=self._lookback_minutes
         )
 
         try:
-            async with CloudflareConnectionManager(
-                api_token=self._api_token,
-                api_key=self._api_key,
-                email=self._email,
-                verify_ssl=self._verify_ssl,
-            ) as client:
+            if self._runtime is not None:
+                client = await self._runtime.client(
+                    api_token=self._api_token,
+                    api_key=self._api_key,
+                    email=self._email,
+                    verify_ssl=self._verify_ssl,
+                )
+            else:
+                client = CloudflareConnectionManager(
+                    api_token=self._api_token,
+                    api_key=self._api_key,
+                    email=self._email,
+                    verify_ssl=self._verify_ssl,
+                    transport=self._transport,
+                )
+            async with client:
                 zone_names: dict[str, str] = {}
                 for zone_id in self._zone_ids:
                     zone_names[zone_id] = await client.fetch_zone_name(zone_id)
@@ -113,16 +257,18 @@ class CloudFlareWatcher:
                     stop_event = self._stop_event
                     if stop_event is None:
                         break
-                    try:
-                        await asyncio.wait_for(stop_event.wait(), timeout=self._poll_interval)
-                    except TimeoutError:
-                        pass
+                    await self._sleep(self._poll_interval, stop_event)
         finally:
             self._running = False
             self._stop_event = None
+            await self._close_outputs()
 
     async def stop(self) -> None:
-        """Signal the polling loop to exit after the current cycle."""
+        """Signal the polling loop to exit after the current cycle.
+
+        Events already queued for sync handlers are drained, and sinks
+        flushed, before :meth:`start` returns.
+        """
         self._running = False
         if self._stop_event:
             self._stop_event.set()
@@ -132,40 +278,81 @@ class CloudFlareWatcher:
         client: CloudflareConnectionManager,
         zone_names: dict[str, str],
     ) -> None:
-        for zone_id in self._zone_ids:
-            if not self._running:
-                return
-            since = self._last_seen.get(zone_id)
-            try:
+        # Zones are polled concurrently so a slow zone does not hold up the
+        # others; with a runtime, its poll slots cap how many run at once.
+        await asyncio.gather(
+            *(self._poll_zone(client, zone_id, zone_names) for zone_id in self._zone_ids)
+        )
+
+    async def _poll_zone(
+        self,
+        client: CloudflareConnectionManager,
+        zone_id: str,
+        zone_names: dict[str, str],
+    ) -> None:
+        if not self._running:
+            return
+        since = self._last_seen.get(zone_id)
+        query_from = since
+        if since and zone_id in self._watermarked:
+            query_from = since - self._allowed_lateness
+        previous = self._last_poll.get(zone_id)
+        try:
+            async with self._poll_slot():
+                polled_at = self._now()
                 raw_events = await client.fetch_security_events(
-                    zone_id, since=self._ts_str(since) if since else None
+                    zone_id, since=self._ts_str(query_from) if query_from else None
                 )
-            except Exception as exc:
-                await self._dispatch_error(exc)
-                continue
-            if not self._running:
-                return
-
-            new: list[tuple[datetime.datetime | None, dict[str, object]]] = []
-            for raw in raw_events:
-                ev_ts = self._parse_ts(raw)
-                if since and ev_ts and ev_ts <= since:
+        except Exception as exc:
+            await self._dispatch_error(exc)
+            return
+        self._last_poll[zone_id] = (polled_at, query_from)
+        if not self._running:
+            return
+
+        seen = self._seen_ray_ids.setdefault(zone_id, {})
+        new: list[tuple[datetime.datetime | None, dict[str, object]]] = []
+        for raw in raw_events:
+            ev_ts = self._parse_ts(raw)
+            ray_id = self._ray_id(raw)
+            if ray_id:
+                if ray_id in seen or (query_from and ev_ts and ev_ts < query_from):
                     continue
-                new.append((ev_ts, raw))
-
-            if not new:
+            elif since and ev_ts and ev_ts <= since:
                 continue
-
-            new.sort(key=lambda x: x[0] or datetime.datetime.now(datetime.timezone.utc))
-            latest = since
-            for ev_ts, raw in new:
-                event = self._to_event(zone_id, zone_names.get(zone_id, zone_id), raw, ev_ts)
-                await self._dispatch(event)
-                if ev_ts:
-                    latest = ev_ts if latest is None else max(latest, ev_ts)
-
-            if latest:
-                self._last_seen[zone_id] = latest
+            new.append((ev_ts, raw))
+
+        if not new:
+            return
+
+        new.sort(key=lambda x: x[0] or polled_at)
+        latest = since
+        for ev_ts, raw in new:
+            event = self._to_event(zone_id, zone_names.get(zone_id, zone_id), raw, ev_ts)
+            if event.ray_id:
+                seen[event.ray_id] = ev_ts or since
+            lateness = self._missed_by(previous, ev_ts)
+            if lateness:
+                if lateness > self._lateness.get(zone_id, datetime.timedelta(0)):
+                    self._lateness[zone_id] = lateness
+                logger.debug(
+                    "Late event for zone %s: ray_id=%s missed by a poll %s after it occurred",
+                    zone_id,
+                    event.ray_id,
+                    lateness,
+                )
+            await self._dispatch(event)
+            if ev_ts:
+                latest = ev_ts if latest is None else max(latest, ev_ts)
+                self._watermarked.add(zone_id)
+
+        if latest:
+            self._last_seen[zone_id] = latest
+            # Ray IDs older than the next query window can no longer be returned.
+            horizon = latest - self._allowed_lateness
+            for ray_id, ts in list(seen.items()):
+                if ts is None or ts < horizon:
+                    del seen[ray_id]
 
     async def _dispatch(self, event: SecurityEvent) -> None:
         for handler in self._handlers:
@@ -174,6 +361,38 @@ class CloudFlareWatcher:
             except Exception as exc:
                 logger.exception("Event handler raised for ray_id=%s", event.ray_id)
                 await self._dispatch_error(exc)
+        for offloaded in self._offloaded:
+            await offloaded.submit(event)
+        for sink in self._sinks:
+            await sink.write(event)
+
+    async def drain(self) -> None:
+        """Wait until every sync handler has processed the events queued so far.
+
+        Useful after a burst, or in tests, to know that queued events were
+        handled without stopping the watcher.
+        """
+        for offloaded in self._offloaded:
+            await offloaded.drain()
+
+    async def _close_outputs(self) -> None:
+        """Drain and close every sync handler, then every sink, even if one fails.
+
+        Errors are reported to the error handlers. A cancellation is held
+        back until everything has been closed, then raised again.
+        """
+        cancelled = False
+        outputs: list[OffloadedHandler | EventSink] = [*self._offloaded, *self._sinks]
+        for output in outputs:
+            try:
+                await output.close()
+            except asyncio.CancelledError:
+                cancelled = True
+            except Exception as exc:
+                logger.exception("Failed to close %s", type(output).__name__)
+                await self._dispatch_error(exc)
+        if cancelled:
+            raise asyncio.CancelledError
 
     async def _dispatch_error(self, error: Exception) -> None:
         for handler in self._error_handlers:
@@ -184,6 +403,48 @@ class CloudFlareWatcher:
 
     # ------------------------------------------------------------------ helpers
 
+    def _active_transport(self) -> Transport | None:
+        return self._runtime.transport if self._runtime is not None else self._transport
+
+    def _now(self) -> datetime.datetime:
+        # A replay transport supplies the recording's clock.
+        transport = self._active_transport()
+        if transport is not None:
+            return transport.now()
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    async def _sleep(self, seconds: float, stop_event: asyncio.Event) -> None:
+        """Wait ``seconds`` on the transport's clock, or until ``stop_event`` is set."""
+        transport = self._active_transport()
+        sleeper = asyncio.ensure_future(
+            transport.sleep(seconds) if transport is not None else asyncio.sleep(seconds)
+        )
+        stopper = asyncio.ensure_future(stop_event.wait())
+        try:
+            await asyncio.wait({sleeper, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeper.cancel()
+            stopper.cancel()
+            await asyncio.gather(sleeper, stopper, return_exceptions=True)
+
+    @staticmethod
+    def _missed_by(
+        previous: tuple[datetime.datetime, datetime.datetime | None] | None,
+        ev_ts: datetime.datetime | None,
+    ) -> datetime.timedelta | None:
+        """How long after ``ev_ts`` the previous poll ran without returning the event."""
+        if previous is None or ev_ts is None:
+            return None
+        polled_at, window_start = previous
+        if ev_ts >= polled_at or (window_start and ev_ts < window_start):
+            return None
+        return polled_at - ev_ts
+
+    def _poll_slot(self) -> contextlib.AbstractAsyncContextManager[object]:
+        if self._runtime is None:
+            return contextlib.nullcontext()
+        return self._runtime.poll_slot()
+
     @staticmethod
     def _parse_ts(raw: dict[str, object]) -> datetime.datetime | None:
         for key in ("occurred_at", "datetime", "timestamp", "time"):
@@ -196,6 +457,10 @@ class CloudFlareWatcher:
                 continue
         return None
 
+    @staticmethod
+    def _ray_id(raw: dict[str, object]) -> str:
+        return str(raw.get("ray_id") or raw.get("rayid") or "")
+
     @staticmethod
     def _ts_str(ts: datetime.datetime) -> str:
         if ts.tzinfo is None:
@@ -218,7 +483,7 @@ class CloudFlareWatcher:
             country=str(raw.get("client_country_name") or raw.get("country") or ""),
             rule_id=str(raw.get("rule_id") or ""),
             rule_message=str(raw.get("rule_message") or ""),
-            ray_id=str(raw.get("ray_id") or raw.get("rayid") or ""),
+            ray_id=CloudFlareWatcher._ray_id(raw),
             occurred_at=occurred_at,
             raw=raw,
         )
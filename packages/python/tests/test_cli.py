@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+
+import pytest
+
+from cloudflare_notifier import CloudFlareWatcher, JsonlSink, SQLiteSink, StreamSink, cli
+from cloudflare_notifier.runtime import CloudflareRuntime
+
+
+def _write_config(tmp_path, **data):
+    data.setdefault("zones", ["z1"])
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+# ------------------------------------------------------------------ load_config
+
+class TestLoadConfig:
+    def test_defaults(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CF_API_TOKEN", "tok")
+        config = cli.load_config(_write_config(tmp_path))
+        assert config.zones == ["z1"]
+        assert config.api_token == "tok"
+        assert config.poll_interval == 60
+        assert config.outputs == [{"type": "stdout"}]
+
+    def test_custom_credential_env_names(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("MY_KEY", "k")
+        monkeypatch.setenv("MY_EMAIL", "me@x.com")
+        path = _write_config(
+            tmp_path, credentials={"api_key_env": "MY_KEY", "email_env": "MY_EMAIL"}
+        )
+        config = cli.load_config(path)
+        assert (config.api_key, config.email) == ("k", "me@x.com")
+
+    def test_requires_zones(self, tmp_path):
+        with pytest.raises(ValueError, match="zones"):
+            cli.load_config(_write_config(tmp_path, zones=[]))
+
+    def test_rejects_unknown_output(self, tmp_path):
+        with pytest.raises(ValueError, match="unknown output type"):
+            cli.load_config(_write_config(tmp_path, outputs=[{"type": "kafka"}]))
+
+    def test_file_output_needs_path(self, tmp_path):
+        with pytest.raises(ValueError, match="path"):
+            cli.load_config(_write_config(tmp_path, outputs=[{"type": "sqlite"}]))
+
+    def test_rejects_invalid_json(self, tmp_path):
+        path = tmp_path / "config.json"
+        path.write_text("{")
+        with pytest.raises(ValueError, match="invalid JSON"):
+            cli.load_config(str(path))
+
+
+# ------------------------------------------------------------------ outputs
+
+class TestBuildSink:
+    def test_output_types(self, tmp_path):
+        assert isinstance(cli.build_sink({"type": "stdout"}), StreamSink)
+        jsonl = cli.build_sink({"type": "jsonl", "path": "e.jsonl", "compress": True})
+        assert isinstance(jsonl, JsonlSink) and jsonl.compress
+        sqlite = cli.build_sink({"type": "sqlite", "path": "e.db", "flush_size": 7})
+        assert isinstance(sqlite, SQLiteSink) and sqlite.flush_size == 7
+
+    @pytest.mark.asyncio
+    async def test_pipe_feeds_child_process(self, tmp_path):
+        out = tmp_path / "piped.jsonl"
+        script = f"import sys; open({str(out)!r}, 'w').write(sys.stdin.read())"
+        sink = cli.build_sink({"type": "pipe", "command": [sys.executable, "-c", script]})
+        await sink.write(CloudFlareWatcher._to_event("z1", "z", {"ray_id": "r1"}, None))
+        await sink.close()
+        assert json.loads(out.read_text())["ray_id"] == "r1"
+
+    @pytest.mark.asyncio
+    async def test_pipe_child_that_ignores_eof_is_terminated(self):
+        script = "import time; time.sleep(60)"
+        sink = cli.build_sink(
+            {"type": "pipe", "command": [sys.executable, "-c", script], "close_timeout": 0.1}
+        )
+        await sink.write(CloudFlareWatcher._to_event("z1", "z", {"ray_id": "r1"}, None))
+        await sink.flush()
+        process = sink._process
+        await asyncio.wait_for(sink.close(), timeout=5)
+        assert process.returncode is not None
+
+
+class _CountingClient:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def fetch_security_events(self, zone_id, *, since=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return []
+
+
+class TestBuildWatcher:
+    @pytest.mark.asyncio
+    async def test_max_concurrent_polls_limits_zone_polls(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CF_API_TOKEN", "tok")
+        path = _write_config(tmp_path, zones=["z1", "z2", "z3", "z4"], max_concurrent_polls=2)
+        _, watcher = cli._build(cli.load_config(path), None)
+        client = _CountingClient()
+        watcher._running = True
+        await watcher._poll(client, {})
+        assert client.peak == 2
+
+
+# ------------------------------------------------------------------ main / serve
+
+class TestMain:
+    def test_missing_credentials_exit_code(self, tmp_path, monkeypatch, capsys):
+        for name in ("CF_API_TOKEN", "CF_API_KEY", "CF_EMAIL"):
+            monkeypatch.delenv(name, raising=False)
+        assert cli.main([_write_config(tmp_path)]) == 2
+        assert "api_token" in capsys.readouterr().err
+
+    def test_missing_config_exit_code(self, tmp_path):
+        assert cli.main([str(tmp_path / "nope.json")]) == 2
+
+
+class _OneEventClient:
+    def __init__(self):
+        self.polls = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return None
+
+    async def fetch_zone_name(self, zone_id):
+        return "example.com"
+
+    async def fetch_security_events(self, zone_id, *, since=None):
+        self.polls += 1
+        return [{"ray_id": f"{zone_id}-r1", "datetime": "2099-01-01T00:00:00Z"}]
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="POSIX signals only")
+class TestServe:
+    @pytest.mark.asyncio
+    async def test_reload_then_graceful_shutdown(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CF_API_TOKEN", "tok")
+        client = _OneEventClient()
+
+        async def fake_client(self, **_):
+            return client
+
+        monkeypatch.setattr(CloudflareRuntime, "client", fake_client)
+        out = tmp_path / "events.jsonl"
+        outputs = [{"type": "jsonl", "path": str(out)}]
+        path = _write_config(tmp_path, zones=["z1"], poll_interval=0, outputs=outputs)
+
+        task = asyncio.create_task(cli.serve(path))
+        await asyncio.sleep(0.05)
+
+        _write_config(tmp_path, zones=["z1", "z2"], poll_interval=0, outputs=outputs)
+        os.kill(os.getpid(), signal.SIGHUP)
+        await asyncio.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(task, timeout=2)
+
+        ray_ids = [json.loads(line)["ray_id"] for line in out.read_text().splitlines()]
+        # z1's watermark carries over the reload, so its event is written once.
+        assert sorted(ray_ids) == ["z1-r1", "z2-r1"]
+
+    @pytest.mark.asyncio
+    async def test_bad_reload_keeps_current_watcher(self, tmp_path, monkeypatch, caplog):
+        monkeypatch.setenv("CF_API_TOKEN", "tok")
+        monkeypatch.delenv("MISSING_TOKEN", raising=False)
+        client = _OneEventClient()
+
+        async def fake_client(self, **_):
+            return client
+
+        monkeypatch.setattr(CloudflareRuntime, "client", fake_client)
+        path = _write_config(tmp_path, zones=["z1"], poll_interval=0)
+
+        task = asyncio.create_task(cli.serve(path))
+        await asyncio.sleep(0.05)
+
+        _write_config(
+            tmp_path, zones=["z1"], poll_interval=0, credentials={"api_token_env": "MISSING_TOKEN"}
+        )
+        os.kill(os.getpid(), signal.SIGHUP)
+        await asyncio.sleep(0.05)
+        polls = client.polls
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        assert client.polls > polls
+        assert "Reload failed" in caplog.text
+
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(task, timeout=2)
@@ -1,4 +1,10 @@
-from cloudflare_notifier._connection import CloudflareConnectionManager
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from cloudflare_notifier._connection import CloudflareConnectionManager, RequestBudget
 
 
 class TestExtractEvents:
@@ -44,3 +50,76 @@ class TestHeaders:
 
     def test_content_type_always_present(self):
         assert CloudflareConnectionManager()._headers()["Content-Type"] == "application/json"
+
+
+class TestRequestBudget:
+    def test_rejects_invalid_rate(self):
+        with pytest.raises(ValueError, match="rate"):
+            RequestBudget(0, 1.0)
+
+    @pytest.mark.asyncio
+    async def test_burst_up_to_rate_is_immediate(self):
+        budget = RequestBudget(3, 60.0)
+        await asyncio.wait_for(
+            asyncio.gather(*(budget.acquire() for _ in range(3))), timeout=0.1
+        )
+
+    @pytest.mark.asyncio
+    async def test_waits_once_budget_is_spent(self):
+        budget = RequestBudget(2, 0.2)
+        await budget.acquire()
+        await budget.acquire()
+        started = time.monotonic()
+        await budget.acquire()
+        assert time.monotonic() - started >= 0.08
+
+
+class TestSharedSession:
+    @pytest.mark.asyncio
+    async def test_does_not_close_session_it_does_not_own(self):
+        async with aiohttp.ClientSession() as session:
+            async with CloudflareConnectionManager(api_token="t", session=session):
+                pass
+            assert not session.closed
+
+
+class _CountingTransport:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def request(self, method, url, *, headers, params=None, json=None, ssl=True):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.responses.pop(0)
+
+
+class TestZoneName:
+    @pytest.mark.asyncio
+    async def test_failed_lookup_is_not_cached(self):
+        transport = _CountingTransport(
+            [(403, {"success": False}), (200, {"success": True, "result": {"name": "a.com"}})]
+        )
+        client = CloudflareConnectionManager(api_token="t", transport=transport)
+        assert await client.fetch_zone_name("z1") == "z1"
+        assert await client.fetch_zone_name("z1") == "a.com"
+        assert await client.fetch_zone_name("z1") == "a.com"
+        assert transport.calls == 2
+
+
+class TestCoalescing:
+    @pytest.mark.asyncio
+    async def test_identical_concurrent_fetches_share_one_request(self):
+        ok = (200, {"success": True, "result": [{"ray_id": "r1"}]})
+        transport = _CountingTransport([ok, ok])
+        client = CloudflareConnectionManager(api_token="t", transport=transport)
+        a, b = await asyncio.gather(
+            client.fetch_security_events("z1", since="2024-01-01T12:00:00Z"),
+            client.fetch_security_events("z1", since="2024-01-01T12:00:00Z"),
+        )
+        assert a == b == [{"ray_id": "r1"}]
+        assert a is not b
+        assert transport.calls == 1
+
+        await client.fetch_security_events("z1", since="2024-01-01T12:00:00Z")
+        assert transport.calls == 2
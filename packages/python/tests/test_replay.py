@@ -0,0 +1,253 @@
+import asyncio
+import datetime
+import gzip
+import json
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from cloudflare_notifier import (
+    CloudflareRuntime,
+    CloudFlareWatcher,
+    RecordingTransport,
+    ReplayTransport,
+)
+from cloudflare_notifier._connection import CloudflareConnectionManager
+from cloudflare_notifier.replay import ReplayExhausted
+
+BASE = "https://api.cloudflare.com/client/v4"
+
+
+def _write_log(path, *records):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record) + "\n")
+    return path
+
+
+def _rest(zone_id, t, events, elapsed=0.0):
+    return {
+        "t": t,
+        "elapsed": elapsed,
+        "method": "GET",
+        "url": f"{BASE}/zones/{zone_id}/security/events",
+        "status": 200,
+        "payload": {"success": True, "result": events},
+    }
+
+
+def _zone(zone_id, name):
+    return {
+        "t": 0.0,
+        "elapsed": 0.0,
+        "method": "GET",
+        "url": f"{BASE}/zones/{zone_id}",
+        "status": 200,
+        "payload": {"success": True, "result": {"name": name}},
+    }
+
+
+# ------------------------------------------------------------------ recording
+
+@pytest.fixture
+async def api_server():
+    async def zone(request):
+        return web.json_response({"success": True, "result": {"name": "example.com"}})
+
+    app = web.Application()
+    app.router.add_get("/client/v4/zones/{zone_id}", zone)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/client/v4"
+    await runner.cleanup()
+
+
+class TestRecordingTransport:
+    @pytest.mark.asyncio
+    async def test_records_and_replays_responses(self, api_server, tmp_path):
+        path = tmp_path / "traffic.jsonl.gz"
+        async with RecordingTransport(path) as transport:
+            client = CloudflareConnectionManager(api_token="tok", transport=transport)
+            client.base_url = api_server
+            assert await client.fetch_zone_name("z1") == "example.com"
+
+        with gzip.open(path, "rt") as fh:
+            (record,) = [json.loads(line) for line in fh]
+        assert record["status"] == 200
+        assert record["url"] == f"{api_server}/zones/z1"
+        assert record["elapsed"] >= 0
+
+        replay = ReplayTransport(path, speed=None)
+        client = CloudflareConnectionManager(api_token="tok", transport=replay)
+        client.base_url = api_server
+        assert await client.fetch_zone_name("z1") == "example.com"
+        assert replay.remaining == 0
+
+    @pytest.mark.asyncio
+    async def test_records_connection_errors(self, tmp_path):
+        path = tmp_path / "traffic.jsonl"
+        async with RecordingTransport(path) as transport:
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await transport.request("GET", "http://127.0.0.1:1/zones/z1", headers={})
+
+        replay = ReplayTransport(path, speed=None)
+        with pytest.raises(ConnectionError):
+            await replay.request("GET", "http://127.0.0.1:1/zones/z1", headers={})
+
+
+# ------------------------------------------------------------------ replay
+
+class TestReplayTransport:
+    def test_rejects_invalid_speed(self, tmp_path):
+        path = _write_log(tmp_path / "log.jsonl", _zone("z1", "a"))
+        with pytest.raises(ValueError, match="speed"):
+            ReplayTransport(path, speed=0)
+
+    @pytest.mark.asyncio
+    async def test_matches_by_url_in_recorded_order(self, tmp_path):
+        path = _write_log(
+            tmp_path / "log.jsonl",
+            _rest("z1", 0.0, [{"ray_id": "a"}]),
+            _rest("z2", 0.0, [{"ray_id": "b"}]),
+            _rest("z1", 1.0, [{"ray_id": "c"}]),
+        )
+        replay = ReplayTransport(path, speed=None)
+        client = CloudflareConnectionManager(api_token="tok", transport=replay)
+        assert await client.fetch_security_events("z1") == [{"ray_id": "a"}]
+        assert await client.fetch_security_events("z1") == [{"ray_id": "c"}]
+        assert await client.fetch_security_events("z2") == [{"ray_id": "b"}]
+
+    @pytest.mark.asyncio
+    async def test_scaled_speed_follows_recorded_timeline(self, tmp_path):
+        path = _write_log(
+            tmp_path / "log.jsonl",
+            _rest("z1", 0.0, [], elapsed=0.0),
+            _rest("z1", 1.0, [], elapsed=1.0),
+        )
+        replay = ReplayTransport(path, speed=10)
+        started = time.monotonic()
+        await replay.request("GET", f"{BASE}/zones/z1/security/events", headers={})
+        await replay.request("GET", f"{BASE}/zones/z1/security/events", headers={})
+        assert 0.15 <= time.monotonic() - started < 1.0
+
+    @pytest.mark.asyncio
+    async def test_exhaustion_sets_finished(self, tmp_path):
+        path = _write_log(tmp_path / "log.jsonl", _zone("z1", "a"))
+        replay = ReplayTransport(path, speed=None)
+        await replay.request("GET", f"{BASE}/zones/z1", headers={})
+        assert not replay.finished.is_set()
+        with pytest.raises(ReplayExhausted):
+            await replay.request("GET", f"{BASE}/zones/z1", headers={})
+        assert replay.finished.is_set()
+
+    @pytest.mark.asyncio
+    async def test_drives_watcher(self, tmp_path):
+        path = _write_log(
+            tmp_path / "log.jsonl",
+            _zone("z1", "example.com"),
+            _rest("z1", 0.0, [{"ray_id": "a", "datetime": "2099-01-01T00:00:00Z"}]),
+            _rest("z1", 1.0, [{"ray_id": "b", "datetime": "2099-01-01T00:00:01Z"}]),
+        )
+        replay = ReplayTransport(path, speed=None)
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"], poll_interval=0, transport=replay)
+        seen = []
+
+        @w.on_event
+        async def handle(event):
+            seen.append((event.zone_name, event.ray_id))
+
+        task = asyncio.create_task(w.start())
+        await asyncio.wait_for(replay.finished.wait(), timeout=1)
+        await w.stop()
+        await asyncio.wait_for(task, timeout=1)
+        assert seen == [("example.com", "a"), ("example.com", "b")]
+
+    @pytest.mark.asyncio
+    async def test_old_recording_is_replayed_on_its_own_clock(self, tmp_path):
+        began = time.time() - 2 * 3600
+
+        def stamped(record):
+            return {**record, "at": began + record["t"]}
+
+        def iso(offset):
+            ts = datetime.datetime.fromtimestamp(began + offset, datetime.timezone.utc)
+            return ts.isoformat().replace("+00:00", "Z")
+
+        path = _write_log(
+            tmp_path / "log.jsonl",
+            stamped(_zone("z1", "example.com")),
+            stamped(_rest("z1", 1.0, [{"ray_id": "a", "datetime": iso(-60)}], elapsed=0.5)),
+            stamped(_rest("z1", 2.0, [{"ray_id": "b", "datetime": iso(1.2)}], elapsed=0.5)),
+        )
+        replay = ReplayTransport(path, speed=None)
+        assert replay.now().timestamp() == pytest.approx(began)
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"], poll_interval=0, transport=replay)
+        seen = []
+
+        @w.on_event
+        async def handle(event):
+            seen.append(event.ray_id)
+
+        task = asyncio.create_task(w.start())
+        await asyncio.wait_for(replay.finished.wait(), timeout=1)
+        await w.stop()
+        await asyncio.wait_for(task, timeout=1)
+        assert seen == ["a", "b"]
+        assert replay.now().timestamp() == pytest.approx(began + 2.5)
+
+    @pytest.mark.asyncio
+    async def test_fast_replay_skips_poll_interval(self, tmp_path):
+        path = _write_log(
+            tmp_path / "log.jsonl",
+            _zone("z1", "example.com"),
+            *(
+                _rest("z1", 60.0 * i, [{"ray_id": str(i), "datetime": "2099-01-01T00:00:00Z"}])
+                for i in range(5)
+            ),
+        )
+        replay = ReplayTransport(path, speed=None)
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"], poll_interval=60, transport=replay)
+        seen = []
+
+        @w.on_event
+        async def handle(event):
+            seen.append(event.ray_id)
+
+        task = asyncio.create_task(w.start())
+        await asyncio.wait_for(replay.finished.wait(), timeout=1)
+        await w.stop()
+        await asyncio.wait_for(task, timeout=1)
+        assert seen == ["0", "1", "2", "3", "4"]
+
+    @pytest.mark.asyncio
+    async def test_sleep_is_scaled_by_speed(self, tmp_path):
+        replay = ReplayTransport(_write_log(tmp_path / "log.jsonl", _zone("z1", "a")), speed=10)
+        started = time.monotonic()
+        await replay.sleep(1.0)
+        assert 0.05 <= time.monotonic() - started < 0.5
+
+    @pytest.mark.asyncio
+    async def test_runtime_does_not_rate_limit_replay(self, tmp_path):
+        path = _write_log(
+            tmp_path / "log.jsonl", *(_rest("z1", float(i), []) for i in range(30))
+        )
+        replay = ReplayTransport(path, speed=None)
+        async with CloudflareRuntime(rate_limit=10, transport=replay) as runtime:
+            client = await runtime.client(api_token="tok")
+            assert client.budget is None
+            for _ in range(30):
+                await asyncio.wait_for(client.fetch_security_events("z1"), timeout=1)
+        assert replay.remaining == 0
+
+    def test_watcher_rejects_transport_with_runtime(self, tmp_path):
+        replay = ReplayTransport(_write_log(tmp_path / "log.jsonl", _zone("z1", "a")))
+        with pytest.raises(ValueError, match="transport"):
+            CloudFlareWatcher(
+                api_token="tok", zone_ids=["z1"], runtime=CloudflareRuntime(), transport=replay
+            )
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from cloudflare_notifier import CloudflareRuntime, CloudFlareWatcher
+
+
+class TestClient:
+    @pytest.mark.asyncio
+    async def test_one_client_per_credential(self):
+        async with CloudflareRuntime() as runtime:
+            a = await runtime.client(api_token="tok")
+            b = await runtime.client(api_token="tok")
+            c = await runtime.client(api_token="other")
+        assert a is b
+        assert a is not c
+
+    @pytest.mark.asyncio
+    async def test_clients_share_session_but_not_zone_names(self):
+        async with CloudflareRuntime() as runtime:
+            a = await runtime.client(api_token="tok")
+            b = await runtime.client(api_key="k", email="me@x.com")
+            assert a.session is b.session
+            assert a._zone_cache is not b._zone_cache
+            assert a._rule_message_support is b._rule_message_support
+
+    @pytest.mark.asyncio
+    async def test_zone_names_are_shared_per_credential(self):
+        async with CloudflareRuntime() as runtime:
+            a = await runtime.client(api_token="tok")
+            with pytest.warns(UserWarning, match="verify_ssl"):
+                a_insecure = await runtime.client(api_token="tok", verify_ssl=False)
+            a._zone_cache["z1"] = "example.com"
+            assert await a_insecure.fetch_zone_name("z1") == "example.com"
+
+    @pytest.mark.asyncio
+    async def test_budget_is_per_credential(self):
+        async with CloudflareRuntime(rate_limit=10) as runtime:
+            a = await runtime.client(api_token="tok")
+            with pytest.warns(UserWarning, match="verify_ssl"):
+                a_insecure = await runtime.client(api_token="tok", verify_ssl=False)
+            b = await runtime.client(api_token="other")
+        assert a is not a_insecure
+        assert a.budget is a_insecure.budget
+        assert a.budget is not b.budget
+        assert a.budget.rate == 10
+
+    @pytest.mark.asyncio
+    async def test_close_closes_shared_session(self):
+        runtime = CloudflareRuntime()
+        client = await runtime.client(api_token="tok")
+        await runtime.close()
+        assert client.session.closed
+
+
+class _SlowClient:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def fetch_security_events(self, zone_id, *, since=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return []
+
+
+class TestPollSlots:
+    def test_requires_positive_limit(self):
+        with pytest.raises(ValueError, match="max_concurrent_polls"):
+            CloudflareRuntime(max_concurrent_polls=0)
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrent_polls_across_watchers(self):
+        runtime = CloudflareRuntime(max_concurrent_polls=1)
+        client = _SlowClient()
+        watchers = [
+            CloudFlareWatcher(api_token="tok", zone_ids=["z1", "z2"], runtime=runtime)
+            for _ in range(3)
+        ]
+        for w in watchers:
+            w._running = True
+        await asyncio.gather(*(w._poll(client, {}) for w in watchers))
+        assert client.peak == 1
+
+    @pytest.mark.asyncio
+    async def test_one_watcher_polls_zones_concurrently(self):
+        runtime = CloudflareRuntime(max_concurrent_polls=2)
+        client = _SlowClient()
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1", "z2", "z3"], runtime=runtime)
+        w._running = True
+        await w._poll(client, {})
+        assert client.peak == 2
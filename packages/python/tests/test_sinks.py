@@ -0,0 +1,251 @@
+import asyncio
+import datetime
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+import cloudflare_notifier.watcher as watcher_module
+from cloudflare_notifier import CloudFlareWatcher, EventSink, JsonlSink, SQLiteSink
+
+UTC = datetime.timezone.utc
+
+
+def _event(ray_id, zone_id="z1"):
+    raw = {"action": "block", "ray_id": ray_id, "client_ip": "1.2.3.4"}
+    ts = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=UTC)
+    return CloudFlareWatcher._to_event(zone_id, "example.com", raw, ts)
+
+
+def _read_lines(path, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+# ------------------------------------------------------------------ JsonlSink
+
+class TestJsonlSink:
+    @pytest.mark.asyncio
+    async def test_writes_records_on_close(self, tmp_path):
+        sink = JsonlSink(tmp_path / "events.jsonl")
+        await sink.write(_event("r1"))
+        await sink.write(_event("r2"))
+        assert not (tmp_path / "events.jsonl").exists()
+
+        await sink.close()
+        records = _read_lines(tmp_path / "events.jsonl")
+        assert [r["ray_id"] for r in records] == ["r1", "r2"]
+        assert records[0]["occurred_at"] == "2024-01-01T12:00:00Z"
+        assert records[0]["raw"]["client_ip"] == "1.2.3.4"
+
+    @pytest.mark.asyncio
+    async def test_flushes_when_batch_is_full(self, tmp_path):
+        sink = JsonlSink(tmp_path / "events.jsonl", flush_size=2, flush_interval=0)
+        await sink.write(_event("r1"))
+        await sink.write(_event("r2"))
+        await sink.flush()
+        assert len(_read_lines(tmp_path / "events.jsonl")) == 2
+        await sink.close()
+
+    @pytest.mark.asyncio
+    async def test_skips_duplicate_ray_ids(self, tmp_path):
+        sink = JsonlSink(tmp_path / "events.jsonl")
+        for ray_id in ("r1", "r1", "r2"):
+            await sink.write(_event(ray_id))
+        await sink.flush()
+        await sink.write(_event("r2"))
+        await sink.close()
+        assert [r["ray_id"] for r in _read_lines(tmp_path / "events.jsonl")] == ["r1", "r2"]
+
+    @pytest.mark.asyncio
+    async def test_skips_ray_ids_written_before_restart(self, tmp_path):
+        path = tmp_path / "events.jsonl.gz"
+        sink = JsonlSink(path, compress=True)
+        await sink.write(_event("r1"))
+        await sink.close()
+
+        restarted = JsonlSink(path, compress=True)
+        await restarted.write(_event("r1"))
+        await restarted.write(_event("r2"))
+        await restarted.close()
+        assert [r["ray_id"] for r in _read_lines(path, compress=True)] == ["r1", "r2"]
+
+    @pytest.mark.asyncio
+    async def test_rotates_at_max_bytes(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        sink = JsonlSink(path, max_bytes=1, backup_count=2)
+        for ray_id in ("r1", "r2", "r3", "r4"):
+            await sink.write(_event(ray_id))
+            await sink.flush()
+        await sink.close()
+
+        assert [r["ray_id"] for r in _read_lines(path)] == ["r4"]
+        assert [r["ray_id"] for r in _read_lines(tmp_path / "events.jsonl.1")] == ["r3"]
+        assert [r["ray_id"] for r in _read_lines(tmp_path / "events.jsonl.2")] == ["r2"]
+        assert not (tmp_path / "events.jsonl.3").exists()
+
+    @pytest.mark.asyncio
+    async def test_gzip(self, tmp_path):
+        path = tmp_path / "events.jsonl.gz"
+        sink = JsonlSink(path, compress=True)
+        await sink.write(_event("r1"))
+        await sink.flush()
+        await sink.write(_event("r2"))
+        await sink.close()
+        assert [r["ray_id"] for r in _read_lines(path, compress=True)] == ["r1", "r2"]
+
+
+class TestFailedWrites:
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        path.mkdir()
+        sink = JsonlSink(path, flush_interval=0)
+        await sink.write(_event("r1"))
+        with pytest.raises(OSError):
+            await sink.flush()
+        # The failed ray ID must not count as written.
+        assert "r1" not in sink._seen
+
+        path.rmdir()
+        await sink.write(_event("r2"))
+        await sink.close()
+        assert [r["ray_id"] for r in _read_lines(path)] == ["r1", "r2"]
+
+    @pytest.mark.asyncio
+    async def test_buffer_is_bounded_while_failing(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        path.mkdir()
+        sink = JsonlSink(path, flush_size=2, flush_interval=0, max_buffer=3)
+        for ray_id in ("r1", "r2", "r3", "r4"):
+            sink._buffer.append(_event(ray_id))
+        with pytest.raises(OSError):
+            await sink.flush()
+        assert [e.ray_id for e in sink._buffer] == ["r2", "r3", "r4"]
+
+    @pytest.mark.asyncio
+    async def test_failing_store_is_not_retried_per_event(self):
+        class Failing(EventSink):
+            attempts = 0
+
+            def _write_batch(self, events):
+                Failing.attempts += 1
+                raise OSError("store down")
+
+        sink = Failing(flush_size=10, flush_interval=0)
+        errors = []
+
+        async def on_error(error):
+            errors.append(error)
+
+        sink._on_error = on_error
+        for i in range(500):
+            await sink.write(_event(f"r{i}"))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        assert Failing.attempts == 1
+        assert len(errors) == 1
+        assert len(sink._buffer) == 500
+
+    def test_event_sink_is_abstract(self):
+        with pytest.raises(TypeError):
+            EventSink()  # type: ignore[abstract]
+
+
+# ------------------------------------------------------------------ SQLiteSink
+
+class TestSQLiteSink:
+    @pytest.mark.asyncio
+    async def test_inserts_rows_once_per_ray_id(self, tmp_path):
+        path = tmp_path / "events.db"
+        sink = SQLiteSink(path)
+        for ray_id in ("r1", "r2", "r1"):
+            await sink.write(_event(ray_id))
+        await sink.flush()
+        await sink.write(_event("r2"))
+        await sink.close()
+
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute(
+                "SELECT ray_id, zone_id, occurred_at, raw FROM events ORDER BY ray_id"
+            ).fetchall()
+        assert [r[0] for r in rows] == ["r1", "r2"]
+        assert rows[0][1] == "z1"
+        assert rows[0][2] == "2024-01-01T12:00:00Z"
+        assert json.loads(rows[0][3])["action"] == "block"
+
+    @pytest.mark.asyncio
+    async def test_creates_indexes(self, tmp_path):
+        path = tmp_path / "events.db"
+        sink = SQLiteSink(path)
+        await sink.write(_event("r1"))
+        await sink.close()
+
+        with sqlite3.connect(path) as conn:
+            names = {
+                r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            }
+        assert {"events_zone_time", "events_time", "events_client_ip", "events_rule"} <= names
+
+
+# ------------------------------------------------------------------ watcher integration
+
+class TestAddSink:
+    @pytest.mark.asyncio
+    async def test_dispatch_writes_to_sink(self, tmp_path):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        sink = w.add_sink(JsonlSink(tmp_path / "events.jsonl"))
+
+        await w._dispatch(_event("r1"))
+        await sink.close()
+        assert [r["ray_id"] for r in _read_lines(tmp_path / "events.jsonl")] == ["r1"]
+
+    @pytest.mark.asyncio
+    async def test_write_errors_reach_on_error(self, tmp_path):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        errors = []
+
+        @w.on_error
+        async def on_error(error):
+            errors.append(error)
+
+        # A directory in place of the file makes every write fail.
+        (tmp_path / "events.jsonl").mkdir()
+        sink = w.add_sink(JsonlSink(tmp_path / "events.jsonl"))
+        await w._dispatch(_event("r1"))
+        await sink.close()
+        assert len(errors) == 1
+
+    @pytest.mark.asyncio
+    async def test_failing_close_does_not_skip_other_sinks(self, tmp_path, monkeypatch):
+        class BrokenSink(JsonlSink):
+            def _close(self):
+                raise OSError("disk gone")
+
+        class NoEvents:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *_):
+                return None
+
+            async def fetch_zone_name(self, zone_id):
+                w._running = False
+                return "example.com"
+
+        monkeypatch.setattr(watcher_module, "CloudflareConnectionManager", lambda **_: NoEvents())
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        errors = []
+
+        @w.on_error
+        async def on_error(error):
+            errors.append(str(error))
+
+        w.add_sink(BrokenSink(tmp_path / "broken.jsonl"))
+        w.add_sink(JsonlSink(tmp_path / "events.jsonl"))
+        await w._dispatch(_event("r1"))
+        await w.start()
+        assert errors == ["disk gone"]
+        assert [r["ray_id"] for r in _read_lines(tmp_path / "events.jsonl")] == ["r1"]
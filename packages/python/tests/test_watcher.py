@@ -1,5 +1,8 @@
 import asyncio
 import datetime
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import pytest
 
@@ -198,6 +201,313 @@ class TestDispatch:
         assert errors == ["oops"]
 
 
+# ------------------------------------------------------------------ off-loop handlers
+
+def _raise_in_subprocess(event):
+    raise ValueError(f"bad {event.ray_id}")
+
+
+class TestOffloadedHandlers:
+    def test_sync_handler_is_not_awaited_inline(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+
+        @w.on_event
+        def handler(event: SecurityEvent) -> None:
+            pass
+
+        assert handler not in w._handlers
+        assert w._offloaded[0].func is handler
+
+    def test_decorator_with_options_returns_original_function(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+
+        def handler(event: SecurityEvent) -> None:
+            pass
+
+        assert w.on_event(concurrency=3, batch_size=10)(handler) is handler
+        assert w._offloaded[0].concurrency == 3
+        assert w._offloaded[0].batch_size == 10
+
+    def test_rejects_invalid_concurrency(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        with pytest.raises(ValueError, match="concurrency"):
+            w.on_event(concurrency=0)(lambda e: None)
+
+    @pytest.mark.asyncio
+    async def test_blocking_handler_does_not_block_dispatch(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        release = threading.Event()
+        seen = []
+
+        @w.on_event
+        def blocking(event):
+            release.wait(timeout=5)
+            seen.append(event.ray_id)
+
+        await asyncio.wait_for(
+            w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": "r1"}, None)),
+            timeout=0.5,
+        )
+        assert seen == []
+
+        release.set()
+        await w.drain()
+        assert seen == ["r1"]
+
+    @pytest.mark.asyncio
+    async def test_sync_handler_error_reaches_on_error(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        errors = []
+
+        @w.on_event
+        def bad(event):
+            raise RuntimeError("sync oops")
+
+        @w.on_error
+        async def on_error(error):
+            errors.append(str(error))
+
+        await w._dispatch(CloudFlareWatcher._to_event("z", "z", {}, None))
+        await w.drain()
+        assert errors == ["sync oops"]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_per_handler(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+
+        @w.on_event(executor=ThreadPoolExecutor(max_workers=8), concurrency=2, batch_size=1)
+        def slow(event):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+        for i in range(6):
+            await w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": str(i)}, None))
+        await w.drain()
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_process_pool_receives_batches(self):
+        errors = []
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"], executor=pool)
+            w.on_event(_raise_in_subprocess)
+
+            @w.on_error
+            async def on_error(error):
+                errors.append(error)
+
+            for ray_id in ("a", "b"):
+                await w._dispatch(
+                    CloudFlareWatcher._to_event("z", "z", {"ray_id": ray_id}, None)
+                )
+            await w.drain()
+
+        assert sorted(str(e) for e in errors) == ["bad a", "bad b"]
+        assert all(isinstance(e, ValueError) for e in errors)
+
+    @pytest.mark.asyncio
+    async def test_async_callable_object_stays_on_loop(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        seen = []
+
+        class Handler:
+            async def __call__(self, event):
+                seen.append(event.ray_id)
+
+        w.on_event(Handler())
+        assert len(w._handlers) == 1 and not w._offloaded
+        await w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": "r1"}, None))
+        assert seen == ["r1"]
+
+    @pytest.mark.asyncio
+    async def test_sync_wrapper_returning_coroutine_reports_error(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        errors = []
+
+        async def work(event):
+            pass
+
+        w.on_event(lambda event: work(event))
+
+        @w.on_error
+        async def on_error(error):
+            errors.append(error)
+
+        await w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": "r1"}, None))
+        await w.drain()
+        assert len(errors) == 1
+        assert isinstance(errors[0], TypeError)
+
+    def test_rejects_executor_options_for_async_handler(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+
+        async def handler(event):
+            pass
+
+        with pytest.raises(ValueError, match="sync handlers"):
+            w.on_event(concurrency=2)(handler)
+
+    @pytest.mark.asyncio
+    async def test_full_queue_applies_backpressure(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"])
+        release = threading.Event()
+
+        @w.on_event(max_queue=1)
+        def blocking(event):
+            release.wait(timeout=5)
+
+        # The worker holds the first event, the queue holds the second.
+        for ray_id in ("a", "b"):
+            await w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": ray_id}, None))
+            await asyncio.sleep(0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                w._dispatch(CloudFlareWatcher._to_event("z", "z", {"ray_id": "c"}, None)),
+                timeout=0.1,
+            )
+        release.set()
+        await w.drain()
+
+
+# ------------------------------------------------------------------ watermark
+
+class _ScriptedClient:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.since = []
+
+    async def fetch_security_events(self, zone_id, *, since=None):
+        self.since.append(since)
+        return self.responses.pop(0)
+
+
+def _raw(ray_id, minute):
+    return {"ray_id": ray_id, "datetime": f"2024-01-01T12:{minute:02d}:00Z"}
+
+
+class TestWatermark:
+    def _watcher(self, **kwargs):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["z1"], **kwargs)
+        w._running = True
+        w._last_seen["z1"] = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=UTC)
+        w._watermarked.add("z1")
+        # Each poll runs one minute after the previous one, starting at 12:11.
+        clock = (datetime.datetime(2024, 1, 1, 12, 11 + i, tzinfo=UTC) for i in range(40))
+        w._now = lambda: next(clock)
+        delivered = []
+
+        async def handler(e):
+            delivered.append(e.ray_id)
+
+        w.on_event(handler)
+        return w, delivered
+
+    @pytest.mark.asyncio
+    async def test_queries_with_trailing_overlap(self):
+        w, _ = self._watcher(allowed_lateness=120)
+        client = _ScriptedClient([_raw("a", 10)], [])
+        await w._poll(client, {})
+        await w._poll(client, {})
+        assert client.since == ["2024-01-01T11:58:00Z", "2024-01-01T12:08:00Z"]
+
+    @pytest.mark.asyncio
+    async def test_late_event_inside_overlap_is_delivered_once(self):
+        w, delivered = self._watcher(allowed_lateness=300)
+        client = _ScriptedClient(
+            [_raw("a", 10)],
+            [_raw("a", 10), _raw("late", 7)],
+            [_raw("a", 10), _raw("late", 7)],
+        )
+        for _ in range(3):
+            await w._poll(client, {})
+        assert delivered == ["a", "late"]
+        # The 12:11 poll covered 12:07 but did not return "late".
+        assert w.observed_lateness() == {"z1": datetime.timedelta(minutes=4)}
+
+    @pytest.mark.asyncio
+    async def test_first_poll_starts_at_cutoff_without_lateness(self):
+        w, delivered = self._watcher(allowed_lateness=300)
+        w._watermarked.clear()
+        client = _ScriptedClient([_raw("old", 1), _raw("a", 10)], [_raw("b", 12)])
+        await w._poll(client, {})
+        await w._poll(client, {})
+        assert client.since == ["2024-01-01T12:00:00Z", "2024-01-01T12:05:00Z"]
+        assert delivered == ["old", "a", "b"]
+        assert w.observed_lateness() == {}
+
+    @pytest.mark.asyncio
+    async def test_event_later_than_allowed_is_dropped(self):
+        w, delivered = self._watcher(allowed_lateness=60)
+        client = _ScriptedClient([_raw("a", 10)], [_raw("too-late", 5)])
+        await w._poll(client, {})
+        await w._poll(client, {})
+        assert delivered == ["a"]
+
+    @pytest.mark.asyncio
+    async def test_same_timestamp_different_ray_ids(self):
+        w, delivered = self._watcher()
+        client = _ScriptedClient([_raw("a", 10)], [_raw("a", 10), _raw("b", 10)])
+        await w._poll(client, {})
+        await w._poll(client, {})
+        assert delivered == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_prunes_ray_ids_outside_window(self):
+        w, _ = self._watcher(allowed_lateness=60)
+        client = _ScriptedClient([_raw("a", 10)], [_raw("b", 20)])
+        await w._poll(client, {})
+        await w._poll(client, {})
+        assert set(w._seen_ray_ids["z1"]) == {"b"}
+
+
+class TestResume:
+    @pytest.mark.asyncio
+    async def test_resume_from_keeps_state_for_shared_zones(self):
+        old = CloudFlareWatcher(api_token="tok", zone_ids=["z1", "z2"])
+        old._running = True
+        old._last_seen.update({"z1": None, "z2": None})
+        await old._poll(_ScriptedClient([_raw("a", 10)], [_raw("b", 10)]), {})
+
+        new = CloudFlareWatcher(api_token="tok", zone_ids=["z1", "z3"])
+        new.resume_from(old)
+        assert new._last_seen == {"z1": datetime.datetime(2024, 1, 1, 12, 10, tzinfo=UTC)}
+        assert set(new._seen_ray_ids) == {"z1"}
+        assert new._watermarked == {"z1"}
+
+
+class _SlowZoneClient:
+    async def fetch_security_events(self, zone_id, *, since=None):
+        if zone_id == "slow":
+            await asyncio.sleep(0.2)
+        return [{"ray_id": zone_id, "datetime": "2024-01-01T12:10:00Z"}]
+
+
+class TestConcurrentPolls:
+    @pytest.mark.asyncio
+    async def test_slow_zone_does_not_delay_others(self):
+        w = CloudFlareWatcher(api_token="tok", zone_ids=["slow", "fast"])
+        w._running = True
+        delivered = []
+
+        @w.on_event
+        async def handler(e):
+            delivered.append(e.ray_id)
+
+        poll = asyncio.create_task(w._poll(_SlowZoneClient(), {}))
+        await asyncio.sleep(0.05)
+        assert delivered == ["fast"]
+        await poll
+        assert delivered == ["fast", "slow"]
+
+
 # ------------------------------------------------------------------ start / stop
 
 class _FakeClient: